@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from typing import IO, Any
+
+_STOP = object()
+
+
+class EventLog:
+    """
+    @description   :    structured events written as JSON lines by a background thread, so the sync loop only
+                        pays for a queue put; per-member events are kept with probability `sample`,
+                        the per-group summaries always
+    ---------
+    @Arguments     :    filename: '' disables the log, '-' writes to stdout; a file which cannot be opened
+                        raises OSError here, a failed write disables the log
+    -------
+    """
+
+    def __init__(self, filename: str = '', sample: float = 0.0, batch_size: int = 1000) -> None:
+        self.filename: str = filename
+        self.sample: float = sample
+        self.batch_size: int = batch_size
+        self.__queue: queue.Queue = queue.Queue()
+        self.__thread: threading.Thread = None
+        self.__file: IO = None
+        if filename:
+            self.__file = sys.stdout if filename == '-' else open(filename, 'a')
+            self.__thread = threading.Thread(target=self.__write, name='event-log', daemon=True)
+            self.__thread.start()
+
+    @property
+    def enabled(self) -> bool:
+        return self.__thread is not None and self.__file is not None
+
+    def emit(self, event: str, **fields: Any) -> None:
+        if self.__thread is None or self.__file is None:
+            return
+        fields['event'] = event
+        fields['time'] = time.time()
+        self.__queue.put(fields)
+
+    def member(self, event: str, **fields: Any) -> None:
+        if self.__thread is None or self.sample <= 0:
+            return
+        if self.sample < 1 and random.random() >= self.sample:
+            return
+        self.emit(event, **fields)
+
+    def group(self, name: str, status: str, **counts: Any) -> None:
+        self.emit('group', group=name, status=status, **counts)
+
+    def flush(self) -> None:
+        if self.__thread is not None:
+            self.__queue.join()
+
+    def close(self) -> None:
+        if self.__thread is None:
+            return
+        self.__queue.put(_STOP)
+        self.__thread.join()
+        self.__thread = None
+
+    def __enter__(self) -> 'EventLog':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __write(self) -> None:
+        stop = False
+        while not stop:
+            items = [self.__queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(i is _STOP for i in items)
+            try:
+                if self.__file is not None:
+                    lines = [json.dumps(i, default=str) for i in items if i is not _STOP]
+                    if lines:
+                        self.__file.write('\n'.join(lines) + '\n')
+                        self.__file.flush()
+            except Exception as e:
+                # keep draining so that flush() returns, the sync must not hang on its log
+                print('event log {filename} disabled: {error!r}'.format(filename=self.filename, error=e), file=sys.stderr)
+                self.__close_file()
+            finally:
+                for item in items:
+                    self.__queue.task_done()
+        self.__close_file()
+
+    def __close_file(self) -> None:
+        f, self.__file = self.__file, None
+        if f is not None and f is not sys.stdout:
+            try:
+                f.close()
+            except OSError:
+                pass
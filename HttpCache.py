@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from requests import PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+CACHE_HEADERS = ('Content-Type', 'ETag', 'Link', 'X-Next-Page', 'X-Page', 'X-Per-Page',
+                 'X-Prev-Page', 'X-Total', 'X-Total-Pages')
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass
+class CacheEntry:
+    etag: str
+    headers: dict[str, str]
+    body: bytes
+
+
+class ResponseCache:
+    """
+    @description   :    GET responses stored on disk by ETag, evicted least recently used first
+                        once the cache is bigger than max_bytes
+    ---------
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.stats: CacheStats = CacheStats()
+        self.__lock = threading.Lock()
+        self.__size: int = 0
+        self.__index: OrderedDict[str, int] = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith('.cache'):
+                stat = os.stat(os.path.join(directory, name))
+                files.append((stat.st_mtime, name[:-len('.cache')], stat.st_size))
+        for mtime, key, size in sorted(files):
+            self.__index[key] = size
+            self.__size += size
+
+    def __len__(self) -> int:
+        return len(self.__index)
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    def filename(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.cache')
+
+    @staticmethod
+    def key(request: PreparedRequest) -> str:
+        digest = hashlib.sha1(request.url.encode('utf-8'))
+        for header in ('PRIVATE-TOKEN', 'Authorization', 'JOB-TOKEN'):
+            digest.update(request.headers.get(header, '').encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> CacheEntry:
+        with self.__lock:
+            if key not in self.__index:
+                return None
+            self.__index.move_to_end(key)
+        try:
+            with open(self.filename(key), 'rb') as f:
+                meta, _, body = f.read().partition(b'\n')
+            os.utime(self.filename(key))
+            meta = json.loads(meta)
+        except (OSError, ValueError):
+            self.remove(key)
+            return None
+        return CacheEntry(etag=meta['etag'], headers=meta['headers'], body=body)
+
+    def put(self, key: str, etag: str, response: Response) -> None:
+        headers = {i: response.headers[i] for i in CACHE_HEADERS if i in response.headers}
+        data = json.dumps({'etag': etag, 'headers': headers}).encode('utf-8') + b'\n' + response.content
+        if len(data) > self.max_bytes:
+            return
+        tmp = '{name}.{pid}.{thread}.tmp'.format(name=self.filename(key), pid=os.getpid(), thread=threading.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.filename(key))
+        with self.__lock:
+            self.__size += len(data) - self.__index.pop(key, 0)
+            self.__index[key] = len(data)
+            self.stats.stores += 1
+        self.evict()
+
+    def remove(self, key: str) -> None:
+        with self.__lock:
+            self.__size -= self.__index.pop(key, 0)
+        try:
+            os.remove(self.filename(key))
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        while self.__size > self.max_bytes and self.__index:
+            with self.__lock:
+                key = next(iter(self.__index))
+                self.stats.evictions += 1
+            self.remove(key)
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    @description   :    send If-None-Match for cached GET requests and answer a 304 with the cached body
+    ---------
+    """
+
+    def __init__(self, cache: ResponseCache, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.cache: ResponseCache = cache
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        if request.method != 'GET' or kwargs.get('stream'):
+            return super().send(request, **kwargs)
+        key = self.cache.key(request)
+        entry = self.cache.get(key)
+        if entry is not None:
+            request.headers['If-None-Match'] = entry.etag
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self.cache.stats.hits += 1
+            return self.build_cached_response(request, response, entry)
+        self.cache.stats.misses += 1
+        etag = response.headers.get('ETag')
+        if response.status_code == 200 and etag:
+            self.cache.put(key, etag, response)
+        return response
+
+    def build_cached_response(self, request: PreparedRequest, not_modified: Response, entry: CacheEntry) -> Response:
+        response = Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response._content = entry.body
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.elapsed = not_modified.elapsed
+        response.connection = self
+        return response
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+
+from Sync import *
+
+
+@dataclass
+class Target_Config(MyConfig):
+    name: str = ''
+    sources: list[str] = field(default_factory=list)
+    workers: int = 1
+    state_file: str = ''
+    gitlab: Gitlab_Config = field(default_factory=Gitlab_Config)
+
+    def sync_config(self) -> Sync_Config:
+        return Sync_Config(gitlab=self.gitlab, state_file=self.state_file)
+
+
+@dataclass
+class MultiSync_Config:
+    sources: dict[str, LDAP_Config] = field(default_factory=dict)
+    targets: list[Target_Config] = field(default_factory=list)
+
+    def read_from_json(self, filename='./multi_config.json') -> None:
+        with open(filename) as f:
+            config = json.load(f)
+        for name, value in config['sources'].items():
+            source = LDAP_Config()
+            source.from_dict(value=value)
+            self.sources[name] = source
+        for value in config['targets']:
+            target = Target_Config()
+            target.from_dict(value=value)
+            target.gitlab = Gitlab_Config()
+            target.gitlab.from_dict(value=value.get('gitlab', {}))
+            if not target.sources:
+                target.sources = list(self.sources)
+            self.targets.append(target)
+
+
+class ShardSync(Sync):
+    """
+    @description   :    sync one shard of a target from LDAP groups read by the coordinator;
+                        LDAP is only contacted to read the users that have to be created
+    ---------
+    """
+
+    def __init__(self, target: Target_Config, sources: dict[str, LDAP_Config]) -> None:
+        self.__sources: dict[str, LDAP_Config] = sources
+        self.__ldaps: dict[str, myLDAP] = {}
+        super().__init__(config=target.sync_config())
+
+    def ldap_for(self, dn: str) -> myLDAP:
+        dn = dn.lower()
+        for name, source in self.__sources.items():
+            base = source.base_user.lower()
+            if base and (dn == base or dn.endswith(',' + base)):
+                if name not in self.__ldaps:
+                    self.__ldaps[name] = Sync_Config(LDAP=source).ldap_to()
+                return self.__ldaps[name]
+        return None
+
+
+def sync_target_shard(target: Target_Config, sources: dict[str, LDAP_Config], groups: list[SimpleGroup],
+                      user_table: str = None, full: bool = False) -> tuple[SyncReport, dict[str, GroupState]]:
+    return run_shard(ShardSync(target=target, sources=sources), groups=groups, user_table=user_table, full=full)
+
+
+class MultiSync:
+    def __init__(self, config: Union[str, MultiSync_Config]) -> None:
+        self.__config: MultiSync_Config = MultiSync_Config()
+        self.__groups: dict[str, SimpleGroupList] = {}
+        if isinstance(config, MultiSync_Config):
+            self.__config = config
+        else:
+            self.__config.read_from_json(config)
+
+    @property
+    def config(self) -> MultiSync_Config:
+        return self.__config
+
+    def load_source(self, name: str) -> SimpleGroupList:
+        """read the groups of one LDAP source, only once for all the targets"""
+        if name not in self.__groups:
+            sync_config = Sync_Config(LDAP=self.config.sources[name])
+            myldap = sync_config.ldap_to()
+            self.__groups[name] = myldap.get_users(group_Con=sync_config.group_con,
+                                                   user_Con=sync_config.user_con,
+                                                   strategy=sync_config.LDAP.member_strategy)
+        return self.__groups[name]
+
+    def target_groups(self, target: Target_Config) -> list[SimpleGroup]:
+        merged: dict[str, SimpleGroup] = {}
+        for name in target.sources:
+            for group in self.load_source(name):
+                if group.name in merged:
+                    tmp = merged[group.name]
+                    tmp.member = list(dict.fromkeys(tmp.member + group.member))
+                else:
+                    merged[group.name] = SimpleGroup(name=group.name, member=list(group.member), description=group.description)
+        return list(merged.values())
+
+    def sync_target(self, target: Target_Config, full: bool = False) -> SyncReport:
+        groups = self.target_groups(target)
+        # the shards share the parent namespaces and the users, create them once before forking
+        coordinator = ShardSync(target=target, sources=self.config.sources)
+        mygitlab = coordinator.mygitlab
+        full_paths = [mygitlab.group_path(i.name) for i in groups]
+        if target.gitlab.scoped_snapshot:
+            mygitlab.set_scope(full_paths)
+        mygitlab.ensure_parents(full_paths, visibility=target.gitlab.new_group_visibility)
+        # only the changed groups are provisioned and synced, without checking them again
+        report = SyncReport()
+        changed = [i[0] for i in coordinator.changed_groups(groups, full=full, report=report)]
+        if not changed:
+            return report
+        if target.gitlab.create_user:
+            report.users = coordinator.provision_users(changed)
+
+        shards = [i for i in partition(changed, key=lambda i: i.name, shards=target.workers) if i]
+        if target.workers <= 1 or len(shards) <= 1:
+            # in process the coordinator already holds the connection, the users and the group index
+            results = [run_shard(coordinator, groups=changed, full=True)]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            user_table = new_user_table(mygitlab.myuser_all)
+            try:
+                with ProcessPoolExecutor(max_workers=target.workers) as executor:
+                    futures = [executor.submit(sync_target_shard, target, self.config.sources, shard, user_table, True)
+                               for shard in shards]
+                    results = [i.result() for i in futures]
+            finally:
+                os.remove(user_table)
+
+        state = SyncState(filename=target.state_file)
+        state.load()
+        report.merge(merge_shards(results, state=state))
+        return report
+
+    def sync(self, full: bool = False) -> dict[str, SyncReport]:
+        reports: dict[str, SyncReport] = {}
+        for target in self.config.targets:
+            reports[target.name] = self.sync_target(target, full=full)
+        return reports
+
+
+if __name__ == '__main__':
+    multi = MultiSync(config='./multi_config.json')
+    for name, report in multi.sync().items():
+        print('{name}: {synced} synced, {skipped} skipped, {failed} failed'.format(
+            name=name,
+            synced=len(report.synced_groups),
+            skipped=len(report.skipped_groups),
+            failed=len(report.failed_groups)
+        ))
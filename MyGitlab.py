@@ -1,12 +1,23 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+from __future__ import annotations
 from dataclasses import asdict, dataclass, field
-from typing import Any, Union
+from typing import TYPE_CHECKING, Any, Union
 
-from gitlab import Gitlab, exceptions
-from gitlab.const import *
-from gitlab.v4.objects.groups import Group
-from gitlab.v4.objects.users import User
+if TYPE_CHECKING:
+    from gitlab import Gitlab
+    from gitlab.v4.objects.groups import Group
+    from gitlab.v4.objects.users import User
+
+    from HttpCache import CacheStats, ResponseCache
+
+# same values as gitlab.const, importing python-gitlab pulls in its whole v4 object tree
+NO_ACCESS = 0
+GUEST_ACCESS = 10
+REPORTER_ACCESS = 20
+DEVELOPER_ACCESS = 30
+MAINTAINER_ACCESS = 40
+OWNER_ACCESS = 50
 
 _debug_ = True
 
@@ -17,13 +28,89 @@ class GitlabGroup:
     path: str = None
     visibility: str = 'private'
     description: str = 'Create by LDAP'
+    parent_id: int = None
 
     def __post_init__(self) -> None:
         if self.path is None:
             self.path = self.name
 
     def asdict(self) -> dict[str, Any]:
-        return asdict(self)
+        tmp = asdict(self)
+        if self.parent_id is None:
+            tmp.pop('parent_id')
+        return tmp
+
+
+def join_path(*parts: str) -> str:
+    return '/'.join(i.strip('/') for i in parts if i)
+
+
+@dataclass
+class GroupNode:
+    id: int
+    name: str
+    full_path: str
+    parent_id: int = None
+    obj: Any = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_group(cls, group: Group) -> 'GroupNode':
+        return cls(id=group.get_id(),
+                   name=group.name,
+                   full_path=group.full_path,
+                   parent_id=getattr(group, 'parent_id', None),
+                   obj=group)
+
+
+@dataclass
+class GroupIndex:
+    by_id: dict[int, GroupNode] = field(default_factory=dict)
+    by_path: dict[str, GroupNode] = field(default_factory=dict)
+    children_id: dict[int, list[int]] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.by_path)
+
+    def __iter__(self):
+        return iter(self.by_path.values())
+
+    def add(self, node: GroupNode) -> None:
+        self.by_path[node.full_path.lower()] = node
+        if node.id is None:
+            return
+        self.by_id[node.id] = node
+        if node.parent_id is not None:
+            children = self.children_id.setdefault(node.parent_id, [])
+            if node.id not in children:
+                children.append(node.id)
+
+    def get(self, full_path: str) -> GroupNode:
+        return self.by_path.get(full_path.lower())
+
+    def get_by_id(self, id: int) -> GroupNode:
+        return self.by_id.get(id)
+
+    def parent(self, node: GroupNode) -> GroupNode:
+        return self.by_id.get(node.parent_id)
+
+    def children(self, node: GroupNode) -> list[GroupNode]:
+        return [self.by_id[i] for i in self.children_id.get(node.id, [])]
+
+    def missing_parents(self, full_paths: list[str]) -> list[str]:
+        """
+        @description   :    the parent namespaces of full_paths which are not in the index
+        ---------
+        @Returns       :    the paths sorted by depth, so every parent comes before its children
+        -------
+        """
+        missing: set[str] = set()
+        for full_path in full_paths:
+            parts = full_path.split('/')
+            for i in range(1, len(parts)):
+                parent = '/'.join(parts[:i])
+                if self.get(parent) is None:
+                    missing.add(parent)
+        return sorted(missing, key=lambda i: (i.count('/'), i))
 
 
 @dataclass
@@ -74,12 +161,17 @@ class MyUser:
         return self.asdict_for_create()[attr]
 
 
+def alias_email(user: MyUser) -> str:
+    """the address used when the email of user is already taken in GitLab"""
+    return user.email.replace('@', '+gl-%s@' % user.username)
+
+
 @dataclass
 class MyUserList:
     users: list[MyUser] = field(default_factory=list[MyUser])
 
     def __len__(self) -> int:
-        len(self.users)
+        return len(self.users)
 
     def __getitem__(self, index) -> MyUser:
         return self.users[index]
@@ -112,6 +204,7 @@ class MyGroup:
     id: int
     name: str
     member: MyUserList = field(default_factory=MyUserList)
+    full_path: str = None
 
     def check(self, ref_list: list[Union[int, str]], attr: str) -> tuple[list[Union[int, str], MyUserList]]:
         """
@@ -139,7 +232,7 @@ class MyGroupList:
     groups: list[MyGroup] = field(default_factory=list[MyGroup])
 
     def __len__(self) -> int:
-        len(self.groups)
+        return len(self.groups)
 
     def __getitem__(self, index) -> MyGroup:
         return self.groups[index]
@@ -153,20 +246,35 @@ class MyGroupList:
                 return group
         return None
 
+    def search_by_path(self, full_path: str) -> MyGroup:
+        full_path = full_path.lower()
+        for group in self.groups:
+            if group.full_path is not None and group.full_path.lower() == full_path:
+                return group
+        return None
+
     @property
     def names(self) -> list[str]:
         return [i.name for i in self.groups]
 
 
 class MyGitlab:
-    def __init__(self, url: str = 'http://localhost', access_token: str = None, ssl_verify: bool = False) -> None:
+    def __init__(self, url: str = 'http://localhost', access_token: str = None, ssl_verify: bool = False, namespace: str = '',
+                 cache_dir: str = '', cache_size: int = 64 * 1024 * 1024) -> None:
         self.url: str = url
         self.access_token: str = access_token
         self.ssl_verify: bool = ssl_verify
+        self.namespace: str = namespace.strip('/')
+        self.cache_dir: str = cache_dir
+        self.cache_size: int = cache_size
+        self.cache: ResponseCache = None
         self.gitlab: Gitlab = None
         self.connect_status = False
         self.__my_user_all: MyUserList = None
+        self.__user_all_complete: bool = True
         self.__my_group_all: MyUserList = None
+        self.__group_index: GroupIndex = None
+        self.__scope: set[str] = None
 
     @property
     def myuser_all(self) -> MyUserList:
@@ -184,21 +292,87 @@ class MyGitlab:
             self.__my_group_all = self.get_group_member_all()
         return self.__my_group_all
 
+    @property
+    def group_index(self) -> GroupIndex:
+        if not self.connect_status:
+            return None
+        if self.__group_index is None:
+            self.__group_index = self.get_group_index()
+        return self.__group_index
+
+    @property
+    def cache_stats(self) -> CacheStats:
+        if self.cache is None:
+            return None
+        return self.cache.stats
+
+    @property
+    def dry_run(self) -> bool:
+        return _debug_
+
+    @property
+    def group_snapshot_loaded(self) -> bool:
+        return self.__my_group_all is not None
+
+    @property
+    def scope(self) -> set[str]:
+        return self.__scope
+
+    def set_scope(self, full_paths: list[str]) -> None:
+        """
+        @description   :    restrict the group snapshot to full_paths (None for every indexed group);
+                            without a namespace the index is then built by path lookups instead of a listing;
+                            the same scope again keeps what is already loaded
+        ---------
+        """
+        scope = None if full_paths is None else {i.lower() for i in full_paths}
+        if scope == self.__scope and scope is not None:
+            return
+        self.__scope = scope
+        self.__my_group_all = None
+        if not self.namespace:
+            self.__group_index = None
+
+    def in_scope(self, full_path: str) -> bool:
+        return self.__scope is None or full_path.lower() in self.__scope
+
+    def use_user_table(self, users: Any, complete: bool = True) -> None:
+        """
+        @description   :    answer myuser_all with a prebuilt user table, e.g. a Shard.UserTable shared by the workers;
+                            complete=False when it only holds some of the GitLab users
+        ---------
+        """
+        self.__my_user_all = users
+        self.__user_all_complete = complete
+
+    @property
+    def user_all_complete(self) -> bool:
+        return self.__user_all_complete
+
     def refresh(self) -> None:
         if not self.connect_status:
             self.connect()
         if not self.connect_status:
             return None
         self.__my_user_all = self.get_user_all()
+        self.__user_all_complete = True
+        self.__group_index = self.get_group_index()
         self.__my_group_all = self.get_group_member_all()
 
     def connect(self) -> bool:
+        from gitlab import Gitlab
         self.connect_status = False
         try:
             self.gitlab = Gitlab(url=self.url,
                                  private_token=self.access_token,
                                  ssl_verify=self.ssl_verify
                                  )
+            if self.cache_dir:
+                from HttpCache import CachingAdapter, ResponseCache
+                self.cache = ResponseCache(directory=self.cache_dir, max_bytes=self.cache_size)
+                adapter = CachingAdapter(cache=self.cache)
+                self.gitlab.session.mount('https://', adapter)
+                self.gitlab.session.mount('http://', adapter)
             self.connect_status = True
         except:
             return False
@@ -206,18 +380,103 @@ class MyGitlab:
     def get_group_by_id(self, id=int) -> Group:
         return self.gitlab.groups.get(id=id)
 
-    def get_groups(self) -> list[Group]:
+    def get_groups(self, top_level_only: bool = False) -> list[Group]:
         if not self.connect_status:
             return []
+        if top_level_only:
+            return self.gitlab.groups.list(all=True, top_level_only=True)
         return self.gitlab.groups.list(all=True)
 
+    def get_namespace_groups(self, full_path: str) -> list[Group]:
+        """
+        @description   :    the existing ancestors of full_path, the namespace itself and all its descendants
+        ---------
+        """
+        from gitlab import exceptions
+        if not self.connect_status:
+            return []
+        groups: list[Group] = []
+        parts = full_path.split('/')
+        for i in range(1, len(parts) + 1):
+            try:
+                groups.append(self.gitlab.groups.get('/'.join(parts[:i])))
+            except exceptions.GitlabGetError:
+                return groups
+        groups += groups[-1].descendant_groups.list(all=True)
+        return groups
+
+    def get_groups_by_path(self, full_paths: list[str]) -> list[Group]:
+        """
+        @description   :    look up full_paths and their ancestors one by one, skipping the missing ones
+        ---------
+        """
+        from gitlab import exceptions
+        if not self.connect_status:
+            return []
+        paths: set[str] = set()
+        for full_path in full_paths:
+            parts = full_path.split('/')
+            paths.update('/'.join(parts[:i]) for i in range(1, len(parts) + 1))
+        groups: list[Group] = []
+        for path in sorted(paths, key=lambda i: (i.count('/'), i)):
+            try:
+                groups.append(self.gitlab.groups.get(path))
+            except exceptions.GitlabGetError:
+                pass
+        return groups
+
+    def get_group_index(self) -> GroupIndex:
+        if self.namespace:
+            groups = self.get_namespace_groups(full_path=self.namespace)
+        elif self.__scope is not None:
+            groups = self.get_groups_by_path(full_paths=list(self.__scope))
+        else:
+            groups = self.get_groups(top_level_only=True)
+        index = GroupIndex()
+        for group in groups:
+            index.add(GroupNode.from_group(group))
+        return index
+
     def get_groups_all_names(self) -> list[str]:
-        return [i.full_name for i in self.get_groups()]
+        return [i.full_path for i in self.group_index]
+
+    def group_path(self, name: str) -> str:
+        return join_path(self.namespace, name)
+
+    def ensure_parents(self, full_paths: list[str], visibility: str = 'private') -> None:
+        """
+        @description   :    create the missing parent namespaces of full_paths, one depth level after the other
+        ---------
+        """
+        for full_path in self.group_index.missing_parents(full_paths):
+            parent_path, _, name = full_path.rpartition('/')
+            parent = self.group_index.get(parent_path) if parent_path else None
+            info = GitlabGroup(name=name, visibility=visibility, description='',
+                               parent_id=parent.id if parent is not None else None)
+            group_id = self.group_create(info)
+            if self.group_index.get(full_path) is None:
+                self.group_index.add(GroupNode(id=group_id, name=name, full_path=full_path, parent_id=info.parent_id))
+
+    def group_members(self, group: Union[int, Group]) -> Any:
+        """the members manager of group, also for listed objects without one (e.g. GroupDescendantGroup)"""
+        if not isinstance(group, int):
+            group = group.get_id()
+        return self.gitlab.groups.get(group, lazy=True).members
 
     def get_users_in_group(self, group: Union[int, Group]) -> list[User]:
-        if isinstance(group, int):
-            group = self.get_group_by_id(id=group)
-        return group.members.list(all=True)
+        return self.group_members(group).list(all=True)
+
+    def get_member_ids(self, full_path: str) -> list[int]:
+        """
+        @description   :    the ids of the direct members of a group, without looking up the users
+        ---------
+        @Returns       :    the ids, None when the group does not exist
+        -------
+        """
+        node = self.group_index.get(full_path)
+        if node is None or node.id is None:
+            return None
+        return [i.get_id() for i in self.group_members(node.id).list(all=True, per_page=100)]
 
     def get_user_by_id(self, id: int) -> User:
         return self.gitlab.users.get(id=id)
@@ -233,7 +492,7 @@ class MyGitlab:
                       name=info['name'],
                       email=info['email']
                       )
-        for identity in info['identities']:
+        for identity in info.get('identities', []):
             if identity['provider'] == ext_provider:
                 user.ext_ID.provider = ext_provider
                 user.ext_ID.uid = identity['extern_uid']
@@ -246,11 +505,49 @@ class MyGitlab:
         info = self.get_user_all_info(id=id)
         return self.trans_user_info_2_myuser(info=info, ext_provider=ext_provider)
 
+    def get_user_by_ext_uid(self, extern_uid: str, ext_provider='ldapmain') -> MyUser:
+        if not self.connect_status:
+            return None
+        for gitlab_user in self.gitlab.users.list(extern_uid=extern_uid, provider=ext_provider):
+            user = self.trans_user_info_2_myuser(info=gitlab_user.attributes, ext_provider=ext_provider)
+            user.ext_ID.provider = ext_provider
+            user.ext_ID.uid = extern_uid
+            return user
+        return None
+
+    def get_users_by_ext_uid(self, extern_uids: list[str], ext_provider='ldapmain') -> MyUserList:
+        """
+        @description   :    look up only the given users, instead of reading every user of the instance
+        ---------
+        """
+        user_list = MyUserList()
+        for extern_uid in dict.fromkeys(extern_uids):
+            user = self.get_user_by_ext_uid(extern_uid=extern_uid, ext_provider=ext_provider)
+            if user is not None:
+                user_list.append(user)
+        return user_list
+
+    def username_taken(self, username: str) -> bool:
+        if not self.connect_status:
+            return False
+        return any(i.attributes.get('username', '').lower() == username.lower()
+                   for i in self.gitlab.users.list(username=username))
+
+    def email_taken(self, email: str) -> bool:
+        """only admins see the emails: without one, a user found by searching the full address is taken as a match"""
+        if not self.connect_status:
+            return False
+        return any((i.attributes.get('email') or email).lower() == email.lower()
+                   for i in self.gitlab.users.list(search=email, all=True))
+
     def get_user_all(self) -> MyUserList:
         gitlab_all_user = self.gitlab.users.list(all=True)
-        user_list = MyGroupList()
+        user_list = MyUserList()
         for gitlab_user in gitlab_all_user:
-            info = self.get_user_all_info(id=gitlab_user.get_id())
+            info = gitlab_user.attributes
+            if 'identities' not in info:
+                # only admins get the identities in the user list
+                info = self.get_user_all_info(id=gitlab_user.get_id())
             myuser = self.trans_user_info_2_myuser(info=info)
             user_list.append(myuser)
         return user_list
@@ -258,45 +555,57 @@ class MyGitlab:
     def get_group_member_all(self, ext_provider='ldapmain') -> MyGroupList:
         if not self.connect_status:
             return []
-        group_list = self.get_groups()
         data: MyGroupList = MyGroupList()
-        # print(group_list)
-        for group in group_list:
-            tmp_group = MyGroup(id=group.get_id(), name=group.full_name)
-            members = group.members.list(all=True)
-            # print(members)
-            for member in members:
-                tmp_user = self.get_user_simple(id=member.get_id(), ext_provider=ext_provider)
-                tmp_group.member.append(tmp_user)
-            data.append(tmp_group)
+        for node in self.group_index:
+            if node.obj is not None and self.in_scope(node.full_path):
+                data.append(self.get_group_member(group=node.obj, ext_provider=ext_provider))
         return data
 
+    def get_group_member(self, group: Group, ext_provider='ldapmain') -> MyGroup:
+        tmp_group = MyGroup(id=group.get_id(), name=group.full_name, full_path=group.full_path)
+        for member in self.group_members(group).list(all=True):
+            tmp_user = self.get_user_simple(id=member.get_id(), ext_provider=ext_provider)
+            tmp_group.member.append(tmp_user)
+        return tmp_group
+
+    def search_group(self, full_path: str, ext_provider='ldapmain') -> MyGroup:
+        """
+        @description   :    find one group with its members, without loading the members of every group
+        ---------
+        """
+        if self.__my_group_all is not None:
+            return self.__my_group_all.search_by_path(full_path=full_path)
+        if not self.connect_status:
+            return None
+        node = self.group_index.get(full_path)
+        if node is None or node.obj is None:
+            return None
+        return self.get_group_member(group=node.obj, ext_provider=ext_provider)
+
     def group_create(self, info: GitlabGroup) -> int:
         if _debug_:
             print('Create group with \t:\t', info.asdict())
             return
         g = self.gitlab.groups.create(info.asdict())
-        g.save()
+        if self.__group_index is not None:
+            self.__group_index.add(GroupNode.from_group(g))
         return g.get_id()
 
     def user_create(self, info: MyUser) -> int:
+        """collisions are resolved beforehand (see Provision), a 409 is raised as GitlabCreateError"""
         if _debug_:
             print('Create user with \t:\t', info.asdict_for_create())
             return
-        info_dict = info.asdict_for_create()
-        try:
-            u = self.gitlab.users.create(info_dict)
-        except exceptions as e:
-            if e.response_code == '409':
-                info_dict['email'] = info.email.replace('@', '+gl-%s@' % info.username)
-                u: User = self.gitlab.users.create(info_dict)
+        u: User = self.gitlab.users.create(info.asdict_for_create())
         info.id = u.get_id()
         return info.id
 
     def group_add_member(self, group_info: MyGroup, user_info: Union[MyUser, int], access_level: str = DEVELOPER_ACCESS) -> None:
         if _debug_:
+            if isinstance(user_info, MyUser):
+                user_info = user_info.asdict_for_create()
             print('add {user} into {group}'.format(
-                User=user_info.asdict_for_create(),
+                user=user_info,
                 group=group_info.name
             ))
             return
@@ -5,19 +5,53 @@ from __future__ import annotations
 import json
 # import ldap
 # import ldap.asyncsearch
-from ldap3 import Server, Connection, SAFE_SYNC, ALL, BASE, LEVEL, MODIFY_ADD, MODIFY_DELETE, MODIFY_REPLACE, ALL_ATTRIBUTES, SUBTREE
 
-from dataclasses import dataclass, field
-from abc import abstractmethod
+from dataclasses import dataclass, field, replace
 from copy import deepcopy
-from typing import Any
-
-
-@dataclass
-class Alias:
-    name: str = "cn"
-    member: str = "uniqueMember"
-    description: str = "description"
+from typing import TYPE_CHECKING, Any, Iterator
+
+from Schema import CompiledSchema, compile_schema
+
+if TYPE_CHECKING:
+    from ldap3 import Connection, Server
+
+# same values as the ldap3 constants, so ldap3 is only imported once a connection is made
+BASE = 'BASE'
+LEVEL = 'LEVEL'
+SUBTREE = 'SUBTREE'
+ALL_ATTRIBUTES = '*'
+
+PAGE_SIZE = 1000
+PROBE_SIZE = 50
+PROBE_CHECK = 5
+PAGED_RESULTS_OID = '1.2.840.113556.1.4.319'
+
+
+def escape_filter(value: str) -> str:
+    """escape a value for an LDAP search filter (RFC 4515)"""
+    for char, escaped in (('\\', '\\5c'), ('*', '\\2a'), ('(', '\\28'), (')', '\\29'), ('\0', '\\00')):
+        value = value.replace(char, escaped)
+    return value
+
+
+def ranged_values(data: dict[str, list[str]], attr: str) -> tuple[list[str], int]:
+    """
+    @description   :    read a multi-valued attribute which may be returned with range retrieval,
+                        e.g. AD answers `member;range=0-1499` for big groups
+    ---------
+    @Returns       :    tuple[values, next range start or None when complete]
+    -------
+    """
+    if attr in data:
+        return list(data[attr]), None
+    prefix = attr.lower() + ';range='
+    for key, value in data.items():
+        if key.lower().startswith(prefix):
+            end = key[len(prefix):].split('-')[-1]
+            if end == '*':
+                return list(value), None
+            return list(value), int(end) + 1
+    return [], None
 
 
 @dataclass
@@ -36,7 +70,7 @@ class SimpleGroupList:
     groups: list[SimpleGroup] = field(default_factory=list[SimpleGroup])
 
     def __len__(self) -> int:
-        len(self.groups)
+        return len(self.groups)
 
     def __getitem__(self, index) -> SimpleGroup:
         return self.groups[index]
@@ -66,44 +100,25 @@ class myObject:
 class Group(myObject, SimpleGroup):
     description: str = None
     class_name: str = 'Group'
-
-    @abstractmethod
-    def from_dict(self, result: dict[str, list[str]]) -> None:
-        alias: Alias = Alias(member="member")
-        self._from_dict(result=result, alias=alias)
-
-    def _from_dict(self, result: dict[str, list[str]], alias: Alias = Alias()) -> None:
-        # print(alias)
-        self.dn = result["dn"]
-        data = result["attributes"]
-        self.class_name = data["objectClass"][0]
-        self.name = data[alias.name][0]
-        self.member = data[alias.member]
-        if alias.description in data:
-            self.description = data[alias.description][0]
-        else:
-            self.description = ""
+    member_attr: str = 'member'
+    member_next: int = None
 
     def get_member_rdn(self, user_Con: UserSearchCon, ldap: Connection) -> SimpleGroup:
         sg = SimpleGroup(name=self.name, member=self.member, description=self.description)
         return sg
 
 
+@dataclass
 class posixGroup(Group):
-    gidNumber: int = 0
     class_name: str = 'posixGroup'
-
-    def from_dict(self, result: dict[str, list[str]]) -> None:
-        alias: Alias = Alias(member="memberUid")
-        self._from_dict(result, alias)
-        self.gidNumber = result["attributes"]["gidNumber"]
+    uid_attr: str = 'uid'
 
     def get_member_rdn(self,  user_Con: UserSearchCon, ldap: Connection) -> SimpleGroup:
         usc = deepcopy(user_Con)
-        usc.name_at = 'uid'
+        usc.name_at = self.uid_attr
         sg = SimpleGroup(name=self.name, description=self.description)
         for user_name in self.member:
-            usc.name_like = user_name
+            usc.name_like = escape_filter(user_name)
             try:
                 result = usc.search(ldap=ldap)[2][0]
                 sg.member.append(result["dn"])
@@ -114,14 +129,8 @@ class posixGroup(Group):
 
 @dataclass
 class groupOfUniqueNames(Group):
-    owner: str = None
     class_name: str = 'groupOfUniqueNames'
 
-    def from_dict(self, result: dict[str, list[str]]) -> None:
-        alias: Alias = Alias(member="uniqueMember")
-        self._from_dict(result=result, alias=alias)
-        self.owner = result["attributes"]["owner"][0]
-
     def get_member_rdn(self, user_Con: UserSearchCon, ldap: Connection) -> list[str]:
         base = user_Con.base
         l = len(base)
@@ -178,6 +187,36 @@ class UserSearchCon(SearchCon):
     name_at: str = 'cn'
 
 
+@dataclass
+class DirectoryStats:
+    groups: int = 0
+    users: int = 0
+    ranged_groups: int = 0
+    range_size: int = 0
+    posix_members: int = 0
+    page_size: int = PAGE_SIZE
+    member_of_backed: bool = True
+
+    @property
+    def group_cost(self) -> int:
+        """requests still needed to expand the members from the group side"""
+        ranged = 0
+        if self.range_size > 0:
+            ranged = self.ranged_groups * max(1, -(-self.users // self.range_size) - 1)
+        return ranged + self.posix_members
+
+    @property
+    def memberof_cost(self) -> int:
+        """pages needed to scan the users and invert their memberOf"""
+        return -(-self.users // self.page_size)
+
+    @property
+    def strategy(self) -> str:
+        if self.member_of_backed and self.memberof_cost < self.group_cost:
+            return 'memberof'
+        return 'group'
+
+
 @dataclass
 class LDAP:
     host: str
@@ -188,7 +227,9 @@ class LDAP:
 
 
 class myLDAP:
-    def __init__(self, ldap: LDAP) -> None:
+    def __init__(self, ldap: LDAP, schema: CompiledSchema = None) -> None:
+        from ldap3 import ALL, SAFE_SYNC, Connection, Server
+        self.schema: CompiledSchema = schema or compile_schema()
         # self.ldap: ldap = ldap.initialize(uri=url)
         self.server: Server = Server(ldap.host, use_ssl=ldap.ssl, get_info=ALL)
 
@@ -197,6 +238,7 @@ class myLDAP:
                                            password=ldap.password,
                                            client_strategy=SAFE_SYNC,
                                            auto_bind=True,
+                                           auto_range=False,
                                            read_only=True)
         # self.base_user: str = base_user
         # self.base_group: str = base_group
@@ -206,38 +248,210 @@ class myLDAP:
         status, result, response, info = results
         if not status:
             return []
-        group_list: list[Group] = []
-
-        for row in response:
-            objectClass = row['attributes']['objectClass'][0]
-            if objectClass == 'posixGroup':
-                group = posixGroup()
-            elif objectClass == 'groupOfUniqueNames':
-                group = groupOfUniqueNames()
+        return [self.build_group(row) for row in response if row.get('type', 'searchResEntry') == 'searchResEntry']
+
+    def build_group(self, row: dict) -> Group:
+        """build the group of a search row, its kind picked by the schema from all of its object classes"""
+        data = row['attributes']
+        kind = self.schema.group_kind(data.get('objectClass', []))
+        if kind.by_uid:
+            group = posixGroup(uid_attr=self.schema.schema.user_uid)
+        elif kind.user_base_only:
+            group = groupOfUniqueNames()
+        else:
+            group = Group()
+        group.dn = row['dn']
+        group.class_name = kind.object_class
+        group.name = self.schema.group_name(data)
+        group.description = self.schema.group_description(data)
+        group.member_attr = kind.member
+        group.member, group.member_next = ranged_values(data, kind.member)
+        return group
+
+    def get_range_values(self, dn: str, attr: str, start: int) -> list[str]:
+        values: list[str] = []
+        while start is not None:
+            status, result, response, info = self.ldap.search(search_base=dn,
+                                                              search_scope=BASE,
+                                                              search_filter='(objectClass=*)',
+                                                              attributes=['{attr};range={start}-*'.format(attr=attr, start=start)])
+            if not status or not response:
+                break
+            chunk, start = ranged_values(response[0]['attributes'], attr)
+            values += chunk
+        return values
+
+    def paged_search(self, base: str, filterstr: str, attributes: list[str], page_size: int = PAGE_SIZE) -> Iterator[dict]:
+        cookie = None
+        while True:
+            status, result, response, info = self.ldap.search(search_base=base,
+                                                              search_scope=SUBTREE,
+                                                              search_filter=filterstr,
+                                                              attributes=attributes,
+                                                              paged_size=page_size,
+                                                              paged_cookie=cookie)
+            for row in response or []:
+                if row.get('type', 'searchResEntry') == 'searchResEntry':
+                    yield row
+            try:
+                cookie = result['controls'][PAGED_RESULTS_OID]['value']['cookie']
+            except (KeyError, TypeError):
+                cookie = None
+            if not cookie:
+                return
+
+    def member_of_backed(self, groups: list[Group], user_Con: UserSearchCon) -> bool:
+        """
+        @description   :    check on the smallest of groups that their members within the user base carry
+                            memberOf for them, i.e. that the directory keeps memberOf for these group kinds
+        ---------
+        """
+        groups = sorted((i for i in groups if i.member), key=lambda i: len(i.member))[:PROBE_CHECK]
+        if not groups:
+            return True
+        member_of = self.schema.schema.member_of
+        values = ''.join('({attr}={dn})'.format(attr=member_of, dn=escape_filter(i.dn)) for i in groups)
+        filterstr = '(&{base}(|{values}))'.format(base=user_Con.filterstr(), values=values)
+        found: set[tuple[str, str]] = set()
+        for row in self.paged_search(base=user_Con.base, filterstr=filterstr, attributes=[member_of]):
+            for group_dn in row.get('attributes', {}).get(member_of, []):
+                found.add((group_dn.lower(), row['dn'].lower()))
+        base = ',' + user_Con.base.lower()
+        for group in groups:
+            for dn in group.member:
+                if dn.lower().endswith(base) and (group.dn.lower(), dn.lower()) not in found:
+                    return False
+        return True
+
+    def probe(self, headers: list[Group], group_Con: GroupSearchCon, user_Con: UserSearchCon) -> DirectoryStats:
+        """
+        @description   :    estimate both strategies without expanding the groups: headers are the groups loaded
+                            without their dn members, those are only read on PROBE_SIZE groups (first range each),
+                            which give the share of ranged groups, an estimate of the users and the memberOf check
+        ---------
+        """
+        stats = DirectoryStats(groups=len(headers))
+        posix = [i for i in headers if isinstance(i, posixGroup)]
+        stats.posix_members = sum(len(i.member) for i in posix)
+        dn_groups = len(headers) - len(posix)
+        status, result, response, info = self.ldap.search(search_base=group_Con.base,
+                                                          search_scope=SUBTREE,
+                                                          search_filter=group_Con.filterstr(),
+                                                          attributes=group_Con.attrlist,
+                                                          size_limit=PROBE_SIZE)
+        sample = [self.build_group(row) for row in response or [] if row.get('type', 'searchResEntry') == 'searchResEntry']
+        sample = [i for i in sample if not isinstance(i, posixGroup)]
+        ranged = [i for i in sample if i.member_next is not None]
+        if ranged:
+            stats.ranged_groups = -(-len(ranged) * dn_groups // len(sample))
+            stats.range_size = max(len(i.member) for i in ranged)
+        # distinct members of the sample scaled to all the groups, overlaps make it err towards the group side
+        members = {j.lower() for i in sample for j in i.member}
+        scaled = -(-len(members) * dn_groups // len(sample)) if sample else 0
+        stats.users = max(len({j for i in posix for j in i.member}), scaled)
+        if stats.memberof_cost < stats.group_cost:
+            stats.member_of_backed = self.member_of_backed(sample, user_Con=user_Con)
+        return stats
+
+    def get_member_of(self, user_Con: UserSearchCon) -> tuple[dict[str, list[str]], dict[str, str]]:
+        """
+        @description   :    scan the users once and invert their memberOf
+        ---------
+        @Returns       :    tuple[group dn (lower case) -> user dn list, uid -> user dn]
+        -------
+        """
+        group_members: dict[str, list[str]] = {}
+        uid_dn: dict[str, str] = {}
+        member_of, uid_attr = self.schema.schema.member_of, self.schema.schema.user_uid
+        for row in self.paged_search(base=user_Con.base, filterstr=user_Con.filterstr(), attributes=[member_of, uid_attr]):
+            data = row.get('attributes', {})
+            uids = data.get(uid_attr, [])
+            for uid in [uids] if isinstance(uids, str) else uids:
+                uid_dn[uid] = row['dn']
+            for group_dn in data.get(member_of, []):
+                group_members.setdefault(group_dn.lower(), []).append(row['dn'])
+        return group_members, uid_dn
+
+    def get_users_by_member_of(self, group_list: list[Group], user_Con: UserSearchCon) -> SimpleGroupList:
+        group_members, uid_dn = self.get_member_of(user_Con=user_Con)
+        data = SimpleGroupList()
+        for group in group_list:
+            if isinstance(group, posixGroup):
+                member = [uid_dn[i] for i in group.member if i in uid_dn]
             else:
-                group = Group()
-            group.from_dict(row)
-            group_list.append(group)
-        return group_list
+                member = group_members.get(group.dn.lower(), [])
+            data.append(SimpleGroup(name=group.name, member=member, description=group.description))
+        return data
 
-    def get_users(self, group_Con: GroupSearchCon, user_Con: UserSearchCon) -> SimpleGroupList:
-        group_list = self.get_groups(condition=group_Con)
+    def get_users_by_group(self, group_list: list[Group], user_Con: UserSearchCon) -> SimpleGroupList:
         data = SimpleGroupList()
         for group in group_list:
+            if group.member_next is not None:
+                group.member += self.get_range_values(dn=group.dn, attr=group.member_attr, start=group.member_next)
+                group.member_next = None
             tmp = group.get_member_rdn(user_Con, ldap=self.ldap)
             if tmp is not None:
                 data.append(tmp)
         return data
 
-    def search_dn(self, dn: str) -> tuple[bool, dict, dict, dict]:
+    def get_users(self, group_Con: GroupSearchCon, user_Con: UserSearchCon, strategy: str = 'auto') -> SimpleGroupList:
+        """
+        @description   :    load the members of every group
+        ---------
+        @Arguments     :    strategy: 'group' expands each group's member attribute (with range retrieval),
+                            'memberof' scans the users once and inverts memberOf,
+                            'auto' picks the cheaper one from the directory statistics
+        -------
+        """
+        if strategy == 'group':
+            return self.get_users_by_group(self.get_groups(condition=group_Con), user_Con=user_Con)
+        headers = self.get_groups(condition=replace(group_Con, attrlist=self.schema.header_attributes))
+        if strategy == 'auto' and self.probe(headers, group_Con=group_Con, user_Con=user_Con).strategy == 'group':
+            return self.get_users_by_group(self.get_groups(condition=group_Con), user_Con=user_Con)
+        return self.get_users_by_member_of(headers, user_Con=user_Con)
+
+    def search_dn(self, dn: str, attributes: list[str] = ALL_ATTRIBUTES) -> tuple[bool, dict, dict, dict]:
         results = self.ldap.search(search_base=dn,
                                    search_scope=BASE,
                                    search_filter='(objectClass=*)',
-                                   attributes=ALL_ATTRIBUTES)
+                                   attributes=attributes)
         return results
 
+    def get_member_groups(self, dn: str, condition: GroupSearchCon) -> SimpleGroupList:
+        """
+        @description   :    the groups having dn as a member, by the member attributes of the schema
+        ---------
+        @Returns       :    the groups, with dn as their only member
+        -------
+        """
+        uid_attr = self.schema.schema.user_uid
+        status, result, response, info = self.search_dn(dn=dn, attributes=[uid_attr])
+        if not status or not response:
+            return SimpleGroupList()
+        uids = response[0].get('attributes', {}).get(uid_attr, [])
+        if isinstance(uids, str):
+            uids = [uids]
+        values: list[str] = []
+        for kind in self.schema.kinds + [self.schema.group_kind([])]:
+            targets = uids if kind.by_uid else [dn]
+            values += ['({attr}={value})'.format(attr=kind.member, value=escape_filter(i)) for i in targets]
+        filterstr = '(&{base}(|{values}))'.format(base=condition.filterstr(), values=''.join(dict.fromkeys(values)))
+        schema = self.schema.schema
+        status, result, response, info = self.ldap.search(search_base=condition.base,
+                                                          search_scope=SUBTREE,
+                                                          search_filter=filterstr,
+                                                          attributes=[schema.group_name, schema.group_description])
+        data = SimpleGroupList()
+        for row in response or []:
+            attributes = row.get('attributes', {})
+            name = self.schema.group_name(attributes)
+            if name is None:
+                continue
+            data.append(SimpleGroup(name=name, member=[dn], description=self.schema.group_description(attributes)))
+        return data
+
     def user_info(self, dn: str) -> dict:
-        result = self.search_dn(dn=dn)[2][0]
+        result = self.search_dn(dn=dn, attributes=self.schema.user_attributes)[2][0]
         if 'attributes' in result:
             return result['attributes']
         return {}
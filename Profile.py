@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Callable, Iterator
+
+if TYPE_CHECKING:
+    from requests import Response, Session
+
+PHASE = 'phase'
+GROUP = 'group'
+ENDPOINT = 'endpoint'
+
+PSTATS_FILE = 'sync.pstats'
+COLLAPSED_FILE = 'sync.collapsed'
+SPANS_FILE = 'spans.json'
+
+_ID_SEGMENT = re.compile(r'^(\d+|.*%2[fF].*)$')
+# the segment following one of these is an id or a path, whatever it looks like, but for the /members/all route
+_COLLECTIONS = {'groups', 'users', 'projects', 'members'}
+_ROUTES = {'all'}
+
+
+def endpoint_of(method: str, url: str) -> str:
+    """e.g. GET /api/v4/groups/:id/members for GET https://gitlab/api/v4/groups/a%2Fb/members?page=2"""
+    path = url.split('://', 1)[-1].partition('/')[2].partition('?')[0]
+    segments: list[str] = []
+    for segment in path.split('/'):
+        after_collection = bool(segments) and segments[-1] in _COLLECTIONS and segment not in _ROUTES
+        segments.append(':id' if segment and (after_collection or _ID_SEGMENT.match(segment)) else segment)
+    return '{method} /{path}'.format(method=method, path='/'.join(segments))
+
+
+@dataclass
+class Span:
+    kind: str
+    name: str
+    start: float
+    seconds: float
+
+
+class SpanRecorder:
+    """
+    @description   :    wall-clock spans tagged by kind (phase, group, endpoint) and name;
+                        recording nothing and costing a flag test until enabled
+    ---------
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled: bool = enabled
+        self.spans: list[Span] = []
+        self.__lock: threading.Lock = threading.Lock()
+
+    def record(self, kind: str, name: str, start: float, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.spans.append(Span(kind=kind, name=name, start=start, seconds=seconds))
+
+    @contextmanager
+    def span(self, kind: str, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(kind, name, start=start, seconds=time.perf_counter() - begin)
+
+    def watch_session(self, session: Session) -> None:
+        """time every HTTP request of session as an endpoint span"""
+        def hook(response: Response, *args, **kwargs) -> None:
+            self.record(ENDPOINT, endpoint_of(response.request.method, response.request.url),
+                        start=time.time() - response.elapsed.total_seconds(),
+                        seconds=response.elapsed.total_seconds())
+        session.hooks.setdefault('response', []).append(hook)
+
+    def save(self, filename: str) -> None:
+        with open(filename, 'w') as f:
+            json.dump([asdict(i) for i in self.spans], f)
+
+    @staticmethod
+    def load(filename: str) -> SpanRecorder:
+        recorder = SpanRecorder()
+        with open(filename) as f:
+            recorder.spans = [Span(**i) for i in json.load(f)]
+        return recorder
+
+    def slowest(self, kind: str, top: int = 10) -> list[tuple[str, float, int]]:
+        """@Returns : list[tuple[name, total seconds, count]], the slowest first"""
+        total: dict[str, float] = {}
+        count: Counter = Counter()
+        for span in self.spans:
+            if span.kind == kind:
+                total[span.name] = total.get(span.name, 0.0) + span.seconds
+                count[span.name] += 1
+        names = sorted(total, key=total.get, reverse=True)[:top]
+        return [(i, total[i], count[i]) for i in names]
+
+
+class StackSampler:
+    """
+    @description   :    sample the stacks of the other threads every `interval` seconds,
+                        counted in the collapsed format of flamegraph.pl and speedscope
+    ---------
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval: float = interval
+        self.stacks: Counter = Counter()
+        self.__stop: threading.Event = threading.Event()
+        self.__thread: threading.Thread = None
+
+    def start(self) -> None:
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, name='stack-sampler', daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+
+    def __run(self) -> None:
+        me = threading.get_ident()
+        names = {}
+        while not self.__stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {i.ident: i.name for i in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{module}:{func}'.format(module=os.path.basename(code.co_filename), func=code.co_name))
+                    frame = frame.f_back
+                stack.append(names.get(ident, 'thread'))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def save(self, filename: str) -> None:
+        with open(filename, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('{stack} {count}\n'.format(stack=stack, count=count))
+
+
+def profile_run(func: Callable[[], Any], directory: str, interval: float = 0.005) -> Any:
+    """
+    @description   :    run func under cProfile and the stack sampler, writing into directory
+                        sync.pstats (for pstats/snakeviz) and sync.collapsed (for flamegraph.pl)
+    ---------
+    """
+    import cProfile
+    os.makedirs(directory, exist_ok=True)
+    profiler = cProfile.Profile()
+    sampler = StackSampler(interval=interval)
+    sampler.start()
+    profiler.enable()
+    try:
+        return func()
+    finally:
+        profiler.disable()
+        sampler.stop()
+        profiler.dump_stats(os.path.join(directory, PSTATS_FILE))
+        sampler.save(os.path.join(directory, COLLAPSED_FILE))
+
+
+def summary(recorder: SpanRecorder, top: int = 10) -> str:
+    lines: list[str] = []
+    for kind, title in ((PHASE, 'phases'), (GROUP, 'slowest groups'), (ENDPOINT, 'slowest endpoints')):
+        rows = recorder.slowest(kind, top=top)
+        if not rows:
+            continue
+        lines.append('{title}:'.format(title=title))
+        for name, seconds, count in rows:
+            lines.append('  {seconds:>10.3f}s {count:>7}  {name}'.format(seconds=seconds, count=count, name=name))
+    return '\n'.join(lines)
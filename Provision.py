@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from MyGitlab import MyGitlab, MyUser, MyUserList, alias_email
+
+EXISTS = 'exists'
+CREATED = 'created'
+CONFLICT = 'conflict'
+FAILED = 'failed'
+DRY_RUN = 'dry_run'
+
+
+@dataclass
+class ProvisionResult:
+    extern_uid: str
+    username: str
+    status: str
+    user_id: int = None
+    email: str = None
+    message: str = ''
+
+
+@dataclass
+class ProvisionReport:
+    results: list[ProvisionResult] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def by_status(self, status: str) -> list[ProvisionResult]:
+        return [i for i in self.results if i.status == status]
+
+    @property
+    def counts(self) -> dict[str, int]:
+        data: dict[str, int] = {}
+        for result in self.results:
+            data[result.status] = data.get(result.status, 0) + 1
+        return data
+
+
+class UserProvisioner:
+    """
+    @description   :    create many users: collisions on username and email are resolved beforehand against
+                        an index of the GitLab users, then the users are created concurrently in bounded batches;
+                        with lookup=True (users only holds some of the GitLab users) every candidate's username
+                        and email are also looked up in GitLab
+    ---------
+    """
+
+    def __init__(self, mygitlab: MyGitlab, users: MyUserList, workers: int = 8, batch_size: int = 100,
+                 lookup: bool = False) -> None:
+        self.mygitlab: MyGitlab = mygitlab
+        self.users: MyUserList = users
+        self.lookup: bool = lookup
+        self.workers: int = max(1, workers)
+        self.batch_size: int = max(1, batch_size)
+        self.__ext_uid: dict[str, MyUser] = {}
+        self.__username: dict[str, MyUser] = {}
+        self.__email: dict[str, MyUser] = {}
+        for user in users:
+            self.index(user)
+
+    def index(self, user: MyUser) -> None:
+        if user.ext_ID.uid:
+            self.__ext_uid[user.ext_ID.uid] = user
+        if user.username:
+            self.__username[user.username.lower()] = user
+        if user.email:
+            self.__email[user.email.lower()] = user
+
+    def known(self, extern_uid: str) -> MyUser:
+        return self.__ext_uid.get(extern_uid)
+
+    def username_taken(self, username: str) -> bool:
+        if username.lower() in self.__username:
+            return True
+        return self.lookup and self.mygitlab.username_taken(username)
+
+    def email_taken(self, email: str) -> bool:
+        if email.lower() in self.__email:
+            return True
+        return self.lookup and self.mygitlab.email_taken(email)
+
+    def check(self, user: MyUser) -> ProvisionResult:
+        """
+        @description   :    resolve the collisions of user, rewriting its email if needed
+        ---------
+        @Returns       :    the final result when the user must not be created, None otherwise
+        -------
+        """
+        result = ProvisionResult(extern_uid=user.ext_ID.uid, username=user.username, status=CONFLICT)
+        existing = self.known(user.ext_ID.uid)
+        if existing is not None:
+            result.status, result.user_id = EXISTS, existing.id
+            return result
+        if not user.username or not user.email:
+            result.message = 'username and email are required'
+            return result
+        if self.username_taken(user.username):
+            result.message = 'username {name} is taken'.format(name=user.username)
+            return result
+        if self.email_taken(user.email):
+            user.email = alias_email(user)
+            if self.email_taken(user.email):
+                result.message = 'email {email} is taken'.format(email=user.email)
+                return result
+        # reserve the username and email against the rest of the batch
+        self.index(user)
+        return None
+
+    def create(self, user: MyUser) -> ProvisionResult:
+        result = ProvisionResult(extern_uid=user.ext_ID.uid, username=user.username, status=CREATED, email=user.email)
+        try:
+            result.user_id = self.mygitlab.user_create(info=user)
+        except Exception as e:
+            # a 409 is a collision the index did not know about, e.g. a user created meanwhile
+            result.status = CONFLICT if getattr(e, 'response_code', None) == 409 else FAILED
+            result.message = repr(e)
+            return result
+        if result.user_id is None:
+            result.status = DRY_RUN
+        return result
+
+    def provision(self, candidates: Iterable[MyUser]) -> ProvisionReport:
+        from concurrent.futures import ThreadPoolExecutor
+        report = ProvisionReport()
+        to_create: list[MyUser] = []
+        for user in candidates:
+            result = self.check(user)
+            if result is None:
+                to_create.append(user)
+            else:
+                report.results.append(result)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for start in range(0, len(to_create), self.batch_size):
+                batch = to_create[start:start + self.batch_size]
+                for user, result in zip(batch, executor.map(self.create, batch)):
+                    report.results.append(result)
+                    if result.status == CREATED:
+                        user.id = result.user_id
+                        self.users.append(user)
+        return report
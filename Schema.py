@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import json
+from copy import deepcopy
+from dataclasses import dataclass, field, fields
+from typing import Any, Callable, Union
+
+Extractor = Callable[[dict[str, Any]], Any]
+
+
+@dataclass
+class GroupKind:
+    object_class: str
+    member: str = 'member'
+    by_uid: bool = False
+    user_base_only: bool = False
+
+
+@dataclass
+class LDAPSchema:
+    user_class: list[str] = field(default_factory=lambda: ['posixAccount'])
+    user_name: str = 'uid'
+    user_display: str = 'cn'
+    user_mail: str = 'mail'
+    user_uid: str = 'uid'
+    member_of: str = 'memberOf'
+    group_name: str = 'cn'
+    group_description: str = 'description'
+    groups: list[GroupKind] = field(default_factory=list)
+    group_class: list[str] = field(default_factory=list)
+    fallback_member: str = 'member'
+
+
+PRESETS: dict[str, LDAPSchema] = {
+    'openldap': LDAPSchema(groups=[GroupKind('groupOfUniqueNames', member='uniqueMember', user_base_only=True),
+                                   GroupKind('posixGroup', member='memberUid', by_uid=True),
+                                   GroupKind('groupOfNames', member='member')],
+                           group_class=['groupOfUniqueNames', 'posixGroup']),
+    'ad': LDAPSchema(user_class=['user'],
+                     user_name='sAMAccountName',
+                     user_display='displayName',
+                     groups=[GroupKind('group', member='member')],
+                     group_class=['group']),
+    'freeipa': LDAPSchema(groups=[GroupKind('groupOfNames', member='member'),
+                                  GroupKind('posixGroup', member='memberUid', by_uid=True)],
+                          group_class=['groupOfNames']),
+}
+
+
+def first_value(attr: str, default: Any = None) -> Extractor:
+    def extract(data: dict[str, Any]) -> Any:
+        value = data.get(attr)
+        if isinstance(value, list):
+            return value[0] if value else default
+        return default if value is None else value
+    return extract
+
+
+class CompiledSchema:
+    """
+    @description   :    a schema turned once into lookup tables and extractor functions
+    ---------
+    """
+
+    def __init__(self, schema: LDAPSchema) -> None:
+        self.schema: LDAPSchema = schema
+        self.__kinds: dict[str, tuple[int, GroupKind]] = {
+            kind.object_class.lower(): (index, kind) for index, kind in enumerate(schema.groups)
+        }
+        self.__fallback: GroupKind = GroupKind(object_class='Group', member=schema.fallback_member)
+        self.group_name: Extractor = first_value(schema.group_name)
+        self.group_description: Extractor = first_value(schema.group_description, default='')
+        self.user_name: Extractor = first_value(schema.user_name)
+        self.user_display: Extractor = first_value(schema.user_display)
+        self.user_mail: Extractor = first_value(schema.user_mail)
+        self.user_class: list[str] = list(schema.user_class)
+        self.group_class: list[str] = list(schema.group_class) or [i.object_class for i in schema.groups]
+        self.group_attributes: list[str] = list(dict.fromkeys(
+            ['objectClass', schema.group_name, schema.group_description, schema.fallback_member]
+            + [i.member for i in schema.groups]))
+        # without the dn member lists, which the memberOf scan replaces
+        self.header_attributes: list[str] = list(dict.fromkeys(
+            ['objectClass', schema.group_name, schema.group_description] + [i.member for i in schema.groups if i.by_uid]))
+        self.user_attributes: list[str] = list(dict.fromkeys(
+            [schema.user_name, schema.user_display, schema.user_mail, schema.user_uid]))
+
+    @property
+    def kinds(self) -> list[GroupKind]:
+        return self.schema.groups
+
+    def group_kind(self, object_classes: Union[str, list[str]]) -> GroupKind:
+        if isinstance(object_classes, str):
+            object_classes = [object_classes]
+        best = None
+        for object_class in object_classes:
+            hit = self.__kinds.get(object_class.lower())
+            if hit is not None and (best is None or hit[0] < best[0]):
+                best = hit
+        return self.__fallback if best is None else best[1]
+
+    def user(self, data: dict[str, Any]) -> tuple[str, str, str]:
+        """@Returns : tuple[username, display name, email]"""
+        return self.user_name(data), self.user_display(data), self.user_mail(data)
+
+
+_COMPILED: dict[str, CompiledSchema] = {}
+
+
+def compile_schema(value: Union[str, dict[str, Any], LDAPSchema] = 'openldap') -> CompiledSchema:
+    """
+    @description   :    compile a preset name ('openldap', 'ad', 'freeipa'), a schema, or a dict overriding
+                        the fields of the preset given by its 'preset' key; names and dicts are compiled
+                        once per process
+    ---------
+    """
+    if isinstance(value, LDAPSchema):
+        return CompiledSchema(value)
+    if isinstance(value, str):
+        value = {'preset': value}
+    key = json.dumps(value, sort_keys=True)
+    if key not in _COMPILED:
+        _COMPILED[key] = _compile(value)
+    return _COMPILED[key]
+
+
+def _compile(value: dict[str, Any]) -> CompiledSchema:
+    preset = value.get('preset', 'openldap')
+    if preset not in PRESETS:
+        raise ValueError('unknown LDAP schema preset {preset!r}, expected one of {names}'.format(
+            preset=preset, names=', '.join(PRESETS)))
+    schema = deepcopy(PRESETS[preset])
+    for item in fields(LDAPSchema):
+        if item.name not in value:
+            continue
+        if item.name == 'groups':
+            schema.groups = [GroupKind(**i) for i in value['groups']]
+        else:
+            setattr(schema, item.name, value[item.name])
+    return CompiledSchema(schema)
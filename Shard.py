@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import mmap
+import struct
+from typing import Callable, Iterable, TypeVar
+
+from MyGitlab import MyUser, extID
+
+T = TypeVar('T')
+
+MAGIC = b'GLUSERS1'
+HEADER = struct.Struct('<8sQ')
+OFFSET = struct.Struct('<Q')
+
+
+def shard_of(key: str, shards: int) -> int:
+    """
+    @description   :    stable shard number of key, the same in every process and every run
+    ---------
+    """
+    if shards <= 1:
+        return 0
+    digest = hashlib.blake2b(key.lower().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+
+def partition(items: Iterable[T], key: Callable[[T], str], shards: int) -> list[list[T]]:
+    data: list[list[T]] = [[] for i in range(max(1, shards))]
+    for item in items:
+        data[shard_of(key(item), shards)].append(item)
+    return data
+
+
+def write_user_table(users: Iterable[MyUser], filename: str) -> int:
+    """
+    @description   :    write the users with an extern_uid as a memory-mappable table sorted by extern_uid,
+                        so every worker process can search it without unpickling its own copy
+    ---------
+    @Returns       :    the number of users written
+    -------
+    """
+    records = sorted((user.ext_ID.uid.encode('utf-8'),
+                      json.dumps([user.id, user.username, user.name, user.email, user.ext_ID.provider]).encode('utf-8'))
+                     for user in users if user.ext_ID.uid)
+    offsets = [0]
+    for key, payload in records:
+        offsets.append(offsets[-1] + len(key) + 1 + len(payload))
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(records)))
+        for offset in offsets:
+            f.write(OFFSET.pack(offset))
+        for key, payload in records:
+            f.write(key + b'\0' + payload)
+    return len(records)
+
+
+class UserTable:
+    """
+    @description   :    read only view of a table written by write_user_table, searched in place with mmap
+    ---------
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename: str = filename
+        with open(filename, 'rb') as f:
+            self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.__count = HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC:
+            raise ValueError('{name} is not a user table'.format(name=filename))
+        self.__data = HEADER.size + OFFSET.size * (self.__count + 1)
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __bounds(self, index: int) -> tuple[int, int]:
+        start, end = struct.unpack_from('<QQ', self.__map, HEADER.size + OFFSET.size * index)
+        return self.__data + start, self.__data + end
+
+    def __key(self, index: int) -> bytes:
+        start, end = self.__bounds(index)
+        return self.__map[start:self.__map.find(b'\0', start, end)]
+
+    def search_by_ext_uid(self, extern_uid: str) -> MyUser:
+        key = extern_uid.encode('utf-8')
+        low, high = 0, self.__count
+        while low < high:
+            middle = (low + high) // 2
+            if self.__key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.__count or self.__key(low) != key:
+            return None
+        start, end = self.__bounds(low)
+        id, username, name, email, provider = json.loads(self.__map[start + len(key) + 1:end])
+        return MyUser(id=id, username=username, name=name, email=email, ext_ID=extID(provider=provider, uid=extern_uid))
+
+    def close(self) -> None:
+        self.__map.close()
@@ -1,8 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+from __future__ import annotations
 import json
+from dataclasses import replace
+import os
+import tempfile
+from EventLog import EventLog
 from MyGitlab import *
 from MyLDAP import *
+from Profile import GROUP, PHASE, SpanRecorder
+from Provision import FAILED, ProvisionResult, UserProvisioner
+from Schema import CompiledSchema, compile_schema
+from Shard import UserTable, partition, write_user_table
+from SyncState import GroupState, SyncState, fingerprint
 
 
 @dataclass
@@ -25,8 +35,10 @@ class LDAP_Config(MyConfig):
     password: str = ''
     base_user: str = ''
     base_group: str = ''
-    group_class: list[str] = field(default_factory=lambda: ["groupOfUniqueNames", "posixGroup"])
+    group_class: list[str] = field(default_factory=list)
     group_like = '*'
+    member_strategy: str = 'auto'
+    schema: Union[str, dict[str, Any]] = 'openldap'
 
 
 @dataclass
@@ -37,57 +49,145 @@ class Gitlab_Config(MyConfig):
     ssl_verify: bool = True
     create_user: bool = False
     new_group_visibility: str = 'private'
+    group_namespace: str = ''
+    scoped_snapshot: bool = True
+    cache_dir: str = ''
+    cache_size_mb: int = 64
+    provision_workers: int = 8
+    provision_batch: int = 100
     ldap_provider: str = 'ldapmain'
+    check_members: bool = True
 
 
 @dataclass
 class Sync_Config:
     gitlab: Gitlab_Config = field(default_factory=Gitlab_Config)
     LDAP: LDAP_Config = field(default_factory=LDAP_Config)
+    state_file: str = ''
+    workers: int = 1
+    events: str = ''
+    event_sample: float = 0.0
+
+    @property
+    def schema(self) -> CompiledSchema:
+        return compile_schema(self.LDAP.schema)
 
     @property
     def user_con(self) -> UserSearchCon:
-        return UserSearchCon(base=self.LDAP.base_user)
+        schema = self.schema
+        return UserSearchCon(base=self.LDAP.base_user, classname=schema.user_class, attrlist=schema.user_attributes)
 
     @property
     def group_con(self) -> UserSearchCon:
+        schema = self.schema
         condition = GroupSearchCon(base=self.LDAP.base_group,
                                    name_like=self.LDAP.group_like,
-                                   classname=self.LDAP.group_class)
+                                   classname=self.LDAP.group_class or schema.group_class,
+                                   attrlist=schema.group_attributes)
         return condition
 
+    def validate(self) -> list[str]:
+        """
+        @description   :    check the values without connecting to LDAP or GitLab
+        ---------
+        @Returns       :    the list of problems, empty when the config is usable
+        -------
+        """
+        errors: list[str] = []
+        for section, key in (('gitlab', 'url'), ('gitlab', 'access'), ('LDAP', 'host'),
+                             ('LDAP', 'base_user'), ('LDAP', 'base_group')):
+            if not getattr(getattr(self, section), key):
+                errors.append('{section}.{key} is not set'.format(section=section, key=key))
+        if self.gitlab.check_attr not in ('extern_uid', 'username', 'name', 'email'):
+            errors.append('gitlab.check_attr must be one of extern_uid, username, name, email')
+        if self.gitlab.new_group_visibility not in ('private', 'internal', 'public'):
+            errors.append('gitlab.new_group_visibility must be one of private, internal, public')
+        if self.LDAP.member_strategy not in ('auto', 'group', 'memberof'):
+            errors.append('LDAP.member_strategy must be one of auto, group, memberof')
+        if not isinstance(self.workers, int) or self.workers < 1:
+            errors.append('workers must be a positive integer')
+        if self.events and self.events != '-' and not os.path.isdir(os.path.dirname(os.path.abspath(self.events))):
+            errors.append('events: the directory of {events} does not exist'.format(events=self.events))
+        try:
+            self.schema
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append('LDAP.schema: {error}'.format(error=e))
+        return errors
+
     def read_from_json(self, filename='./config.json') -> None:
         with open(filename) as f:
             config = json.load(f)
         self.gitlab.from_dict(value=config['gitlab'])
-        self.gitlab.from_dict(value=config['LDAP'])
+        self.LDAP.from_dict(value=config['LDAP'])
+        self.state_file = config.get('state_file', self.state_file)
+        self.workers = config.get('workers', self.workers)
+        self.events = config.get('events', self.events)
+        self.event_sample = config.get('event_sample', self.event_sample)
 
     def weite_to_json(self, filename='./config.json') -> None:
         with open(filename, 'w') as f:
             json.dump(asdict(self), f, indent=4)
 
     def config_to(self) -> tuple[myLDAP, MyGitlab]:
-        ldap_config = self.LDAP
+        return self.ldap_to(), self.gitlab_to()
+
+    def gitlab_to(self) -> MyGitlab:
         gitlab_config = self.gitlab
-        mygitlab = MyGitlab(url=gitlab_config.url, access_token=gitlab_config.access, ssl_verify=gitlab_config.ssl_verify)
+        mygitlab = MyGitlab(url=gitlab_config.url,
+                            access_token=gitlab_config.access,
+                            ssl_verify=gitlab_config.ssl_verify,
+                            namespace=gitlab_config.group_namespace,
+                            cache_dir=gitlab_config.cache_dir,
+                            cache_size=gitlab_config.cache_size_mb * 1024 * 1024)
         mygitlab.connect()
+        return mygitlab
 
+    def ldap_to(self) -> myLDAP:
+        ldap_config = self.LDAP
+        if not ldap_config.host:
+            return None
         ldap = LDAP(host=ldap_config.host,
                     admin=ldap_config.admin,
                     password=ldap_config.password)
-        myldap = myLDAP(ldap=ldap)
-        return myldap, mygitlab
+        return myLDAP(ldap=ldap, schema=self.schema)
+
+
+@dataclass
+class GroupPlan:
+    name: str
+    full_path: str
+    create: bool = False
+    skip: bool = False
+    add: list[str] = field(default_factory=list)
+    create_user: list[str] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+
+
+@dataclass
+class SyncReport:
+    synced_groups: list[str] = field(default_factory=list)
+    skipped_groups: list[str] = field(default_factory=list)
+    failed_groups: list[str] = field(default_factory=list)
+    users: list[ProvisionResult] = field(default_factory=list)
+
+    def merge(self, other: SyncReport) -> None:
+        self.synced_groups += other.synced_groups
+        self.skipped_groups += other.skipped_groups
+        self.failed_groups += other.failed_groups
+        self.users += other.users
 
 
 class Sync:
-    def __init__(self, config: str) -> None:
+    def __init__(self, config: Union[str, Sync_Config]) -> None:
         self.__config: Sync_Config = Sync_Config()
         self.__myldap: myLDAP = None
         self.__mygitlab: MyGitlab = None
-        try:
-            self.init(config=config)
-        except:
-            pass
+        self.__state: SyncState = SyncState()
+        self.__events: EventLog = EventLog()
+        self.__spans: SpanRecorder = SpanRecorder()
+        self.__known: dict[str, bool] = {}
+        # an unreadable config or event log must stop the run here, not as a None client later
+        self.init(config=config)
 
     @property
     def config(self) -> Sync_Config:
@@ -95,28 +195,56 @@ class Sync:
 
     @property
     def myldap(self) -> myLDAP:
+        # bound on first use, so shard workers which only write into GitLab never bind
+        if self.__myldap is None:
+            self.__myldap = self.__config.ldap_to()
         return self.__myldap
 
     @property
     def mygitlab(self) -> MyGitlab:
         return self.__mygitlab
 
-    def init(self, config: str) -> None:
-        self.__config.read_from_json(config)
-        self.__myldap, self.__mygitlab = self.__config.config_to()
+    @property
+    def state(self) -> SyncState:
+        return self.__state
+
+    @property
+    def events(self) -> EventLog:
+        return self.__events
+
+    @property
+    def spans(self) -> SpanRecorder:
+        return self.__spans
+
+    def enable_spans(self) -> SpanRecorder:
+        """time the phases, the groups and the GitLab endpoints of the following runs"""
+        self.__spans.enabled = True
+        if self.mygitlab is not None and self.mygitlab.gitlab is not None:
+            self.__spans.watch_session(self.mygitlab.gitlab.session)
+        return self.__spans
 
-    def ldap_user_to_gitlab(self, ldap_user_attr: dict[int, Any], dn: str) -> MyUser:
-        user = MyUser(id=-1,
-                      username=ldap_user_attr['uid'],
-                      name=ldap_user_attr['cn'],
-                      email=ldap_user_attr['mail']
-                      )
+    def init(self, config: Union[str, Sync_Config]) -> None:
+        if isinstance(config, Sync_Config):
+            self.__config = config
+        else:
+            self.__config.read_from_json(config)
+        self.__state = SyncState(filename=self.__config.state_file)
+        self.__state.load()
+        self.__events = EventLog(filename=self.__config.events, sample=self.__config.event_sample)
+        self.__mygitlab = self.__config.gitlab_to()
+
+    def ldap_user_to_gitlab(self, ldap_user_attr: dict[int, Any], dn: str, schema: CompiledSchema = None) -> MyUser:
+        username, name, email = (schema or self.ldap_for(dn=dn).schema).user(ldap_user_attr)
+        user = MyUser(id=-1, username=username, name=name, email=email)
         user.ext_ID.uid = dn
         user.ext_ID.provider = self.config.gitlab.ldap_provider
         return user
 
     def create_group_in_gitlab_by_ldap(self, ldap_group: SimpleGroup) -> int:
         group_info = GitlabGroup(name=ldap_group.name, visibility=self.config.gitlab.new_group_visibility)
+        parent_path = self.mygitlab.group_path(ldap_group.name).rpartition('/')[0]
+        if parent_path:
+            group_info.parent_id = self.mygitlab.group_index.get(parent_path).id
         if ldap_group.description is not None and ldap_group.description == '':
             group_info.description = ldap_group.description
         group_id = self.mygitlab.group_create(group_info)
@@ -124,44 +252,357 @@ class Sync:
 
     def check_group_member_in_gitlab(self, ldap_group: SimpleGroup) -> tuple[bool, MyGroup, list[str]]:
         absense_items = ldap_group.members
-        gitlab_group_names = self.mygitlab.mygroup_all.names
-        create = ldap_group.name not in gitlab_group_names
+        full_path = self.mygitlab.group_path(ldap_group.name)
+        gitlab_group = self.mygitlab.search_group(full_path=full_path, ext_provider=self.config.gitlab.ldap_provider)
+        create = gitlab_group is None
         if create:
-            group_id = self.create_group_in_gitlab_by_ldap(self, ldap_group=ldap_group)
-            gitlab_group = MyGroup(id=group_id, name=ldap_group.name)
+            group_id = self.create_group_in_gitlab_by_ldap(ldap_group=ldap_group)
+            gitlab_group = MyGroup(id=group_id, name=ldap_group.name, full_path=full_path)
         else:
-            gitlab_group = self.mygitlab.mygroup_all.search(name=ldap_group.name)
-            if gitlab_group is not None:
-                absense_items = gitlab_group.check(red_list=ldap_group.member, attr=self.config.gitlab.check_attr)[0]
+            absense_items = gitlab_group.check(ref_list=ldap_group.member, attr=self.config.gitlab.check_attr)[0]
         return create, gitlab_group, absense_items
 
+    def gitlab_fingerprint(self, gitlab_group: MyGroup) -> str:
+        return fingerprint(i.id for i in gitlab_group.member)
+
+    def group_unchanged(self, ldap_group: SimpleGroup, ldap_fp: str) -> bool:
+        """
+        @description   :    the LDAP fingerprint matches the last sync and the group still exists in GitLab
+                            with the same member ids; those are read with one listing per 100 members and
+                            no user lookup, answered by 304s when the response cache is on.
+                            With gitlab.check_members off only the LDAP side is compared, and drift made in
+                            GitLab is only repaired by a `--full` run.
+                            Members missing from GitLab at the last sync are looked up by extern uid, so
+                            the group is synced again once one of them exists
+        ---------
+        """
+        if not self.state.unchanged(name=ldap_group.name, ldap=ldap_fp):
+            return False
+        if any(self.gitlab_knows(dn) for dn in self.state.groups[ldap_group.name].missing):
+            return False
+        full_path = self.mygitlab.group_path(ldap_group.name)
+        if self.mygitlab.group_snapshot_loaded:
+            gitlab_group = self.mygitlab.mygroup_all.search_by_path(full_path=full_path)
+            if gitlab_group is None:
+                return False
+            return self.state.unchanged(name=ldap_group.name, ldap=ldap_fp, gitlab=self.gitlab_fingerprint(gitlab_group))
+        if self.mygitlab.group_index.get(full_path) is None:
+            return False
+        if not self.config.gitlab.check_members:
+            return True
+        member_ids = self.mygitlab.get_member_ids(full_path=full_path)
+        if member_ids is None:
+            return False
+        return self.state.unchanged(name=ldap_group.name, ldap=ldap_fp, gitlab=fingerprint(member_ids))
+
+    def gitlab_knows(self, extern_uid: str) -> bool:
+        if extern_uid not in self.__known:
+            user = self.mygitlab.get_user_by_ext_uid(extern_uid=extern_uid, ext_provider=self.config.gitlab.ldap_provider)
+            self.__known[extern_uid] = user is not None
+        return self.__known[extern_uid]
+
+    def ldap_for(self, dn: str) -> myLDAP:
+        return self.myldap
+
     def create_user_in_gitlab_by_ldap(self, dn: str) -> int:
-        user_attr = self.myldap.user_info(dn=dn)
+        user_attr = self.ldap_for(dn=dn).user_info(dn=dn)
         user = self.ldap_user_to_gitlab(ldap_user_attr=user_attr, dn=dn)
         return self.mygitlab.user_create(info=user)
 
-    def modify_group_user_into_gitlab_from_ldap(self, ldap_group: SimpleGroup) -> None:
+    def provision_users(self, ldap_group_list: list[SimpleGroup]) -> list[ProvisionResult]:
+        """
+        @description   :    create at once the GitLab users missing for the members of ldap_group_list
+        ---------
+        """
+        provisioner = UserProvisioner(mygitlab=self.mygitlab,
+                                      users=self.mygitlab.myuser_all,
+                                      workers=self.config.gitlab.provision_workers,
+                                      batch_size=self.config.gitlab.provision_batch,
+                                      lookup=not self.mygitlab.user_all_complete)
+        results: list[ProvisionResult] = []
+        candidates: list[MyUser] = []
+        for dn in dict.fromkeys(j for i in ldap_group_list for j in i.members):
+            if provisioner.known(dn) is not None:
+                continue
+            try:
+                user_attr = self.ldap_for(dn=dn).user_info(dn=dn)
+                candidates.append(self.ldap_user_to_gitlab(ldap_user_attr=user_attr, dn=dn))
+            except Exception as e:
+                results.append(ProvisionResult(extern_uid=dn, username=None, status=FAILED, message=repr(e)))
+        return results + provisioner.provision(candidates).results
+
+    def modify_group_user_into_gitlab_from_ldap(self, ldap_group: SimpleGroup,
+                                                provisioned: dict[str, ProvisionResult] = None) -> tuple[MyGroup, list[str], list[str]]:
+        """
+        @description   :    add the missing LDAP members into the GitLab group
+        ---------
+        @Arguments     :    provisioned: extern uid -> result, when the users were already provisioned;
+                            the members GitLab does not know are then missing, without another create attempt
+        -------
+        @Returns       :    tuple[gitlab group, added items, items which could not be added]
+        -------
+        """
         results = self.check_group_member_in_gitlab(ldap_group=ldap_group)
         create, gitlab_group, absense_items = results
+        added: list[str] = []
+        missing: list[str] = []
         for item in absense_items:
             user = self.mygitlab.myuser_all.search_by_ext_uid(extern_uid=item)
-            if user is None and self.config.gitlab.create_user:
+            user_id = None
+            if user is not None:
+                user_id = user.id
+            elif provisioned is not None:
+                result = provisioned.get(item)
+                missing.append(item)
+                self.events.member('member_missing', group=ldap_group.name, user=item,
+                                   status=result.status if result is not None else None)
+                continue
+            elif self.config.gitlab.create_user:
                 try:
                     user_id = self.create_user_in_gitlab_by_ldap(dn=item)
                 except:
-                    continue
-            else:
-                user_id = user.id
-            if user_id is not None:
-                self.mygitlab.group_add_member(group_info=gitlab_group, user_info=user, access_level=DEVELOPER_ACCESS)
+                    pass
+            if user_id is None:
+                missing.append(item)
+                self.events.member('member_missing', group=ldap_group.name, user=item)
+                continue
+            self.mygitlab.group_add_member(group_info=gitlab_group, user_info=user_id, access_level=DEVELOPER_ACCESS)
+            gitlab_group.member.append(user or MyUser(id=user_id, username=None, name=None, email=None))
+            added.append(item)
+            self.events.member('member_added', group=ldap_group.name, user=item)
+        return gitlab_group, added, missing
+
+    def load_ldap_groups(self) -> SimpleGroupList:
+        return self.myldap.get_users(group_Con=self.config.group_con,
+                                     user_Con=self.config.user_con,
+                                     strategy=self.config.LDAP.member_strategy)
 
-    def sync(self) -> None:
-        ldap_group_list = self.myldap.get_users(group_Con=self.config.group_con, user_Con=self.config.user_con)
+    def plan(self, full: bool = False) -> list[GroupPlan]:
+        """
+        @description   :    what sync would do, without writing anything into GitLab
+        ---------
+        """
+        ldap_group_list = self.load_ldap_groups()
+        if self.config.gitlab.scoped_snapshot:
+            self.mygitlab.set_scope([self.mygitlab.group_path(i.name) for i in ldap_group_list])
+        plans: list[GroupPlan] = []
         for ldap_group in ldap_group_list:
+            plan = GroupPlan(name=ldap_group.name, full_path=self.mygitlab.group_path(ldap_group.name))
+            plans.append(plan)
+            if not full and self.group_unchanged(ldap_group, ldap_fp=fingerprint(ldap_group.members)):
+                plan.skip = True
+                continue
+            gitlab_group = self.mygitlab.search_group(full_path=plan.full_path, ext_provider=self.config.gitlab.ldap_provider)
+            plan.create = gitlab_group is None
+            absense_items = ldap_group.members
+            if gitlab_group is not None:
+                absense_items = gitlab_group.check(ref_list=ldap_group.member, attr=self.config.gitlab.check_attr)[0]
+            for item in absense_items:
+                if self.mygitlab.myuser_all.search_by_ext_uid(extern_uid=item) is not None:
+                    plan.add.append(item)
+                elif self.config.gitlab.create_user:
+                    plan.create_user.append(item)
+                    plan.add.append(item)
+                else:
+                    plan.missing.append(item)
+        return plans
+
+    def sync(self, full: bool = False) -> SyncReport:
+        """
+        @description   :    sync every LDAP group; groups whose fingerprints match the last successful sync
+                            are skipped without fetching their GitLab members unless `full` is set
+        ---------
+        """
+        with self.spans.span(PHASE, 'load_ldap'):
+            ldap_group_list = self.load_ldap_groups()
+        if self.config.workers > 1:
+            with self.spans.span(PHASE, 'sharded'):
+                return self.sync_sharded(ldap_group_list, workers=self.config.workers, full=full)
+        return self.sync_groups(ldap_group_list, full=full)
+
+    def sync_sharded(self, ldap_group_list: SimpleGroupList, workers: int, full: bool = False) -> SyncReport:
+        """
+        @description   :    partition the groups by a stable hash of their name across worker processes,
+                            each worker owning the GitLab writes of its shard; the GitLab users are read once
+                            and handed over as a memory-mapped table
+        ---------
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        full_paths = [self.mygitlab.group_path(i.name) for i in ldap_group_list]
+        if self.config.gitlab.scoped_snapshot:
+            self.mygitlab.set_scope(full_paths)
+        self.mygitlab.ensure_parents(full_paths, visibility=self.config.gitlab.new_group_visibility)
+        # the unchanged groups are skipped here, the workers sync the others without checking them again
+        report = SyncReport()
+        changed = [i[0] for i in self.changed_groups(ldap_group_list, full=full, report=report)]
+        self.events.flush()
+        if not changed:
+            return report
+        if self.config.gitlab.create_user:
+            report.users = self.provision_users(changed)
+        shards = [i for i in partition(changed, key=lambda i: i.name, shards=workers) if i]
+        user_table = new_user_table(self.mygitlab.myuser_all)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(sync_shard, replace(self.config, events=shard_events(self.config.events, index)),
+                                           shard, user_table, True)
+                           for index, shard in enumerate(shards)]
+                results = [i.result() for i in futures]
+        finally:
+            os.remove(user_table)
+        report.merge(merge_shards(results, state=self.state))
+        return report
+
+    def load_ldap_named_groups(self, names: list[str]) -> SimpleGroupList:
+        data = SimpleGroupList()
+        for name in names:
+            condition = replace(self.config.group_con, name_like=escape_filter(name))
+            for group in self.myldap.get_users(group_Con=condition, user_Con=self.config.user_con, strategy='group'):
+                data.append(group)
+        return data
+
+    def load_ldap_user_groups(self, dns: list[str]) -> SimpleGroupList:
+        """
+        @description   :    the groups of the given users, each one only listing those users
+        ---------
+        """
+        groups: dict[str, SimpleGroup] = {}
+        for dn in dns:
+            for group in self.myldap.get_member_groups(dn=dn, condition=self.config.group_con):
+                if group.name in groups:
+                    groups[group.name].member.append(dn)
+                else:
+                    groups[group.name] = group
+        return SimpleGroupList(groups=list(groups.values()))
+
+    def sync_targets(self, users: list[str] = None, groups: list[str] = None) -> SyncReport:
+        """
+        @description   :    sync only the given user DNs and group names, reading just those entries from LDAP
+                            and just the affected groups and users from GitLab
+        ---------
+        """
+        complete = self.load_ldap_named_groups(groups or [])
+        names = set(complete.name_list)
+        partial = SimpleGroupList(groups=[i for i in self.load_ldap_user_groups(users or []) if i.name not in names])
+        extern_uids = [j for i in list(complete) + list(partial) for j in i.members]
+        self.mygitlab.use_user_table(self.mygitlab.get_users_by_ext_uid(extern_uids=extern_uids,
+                                                                        ext_provider=self.config.gitlab.ldap_provider),
+                                     complete=False)
+        # partial groups only list the given users, their fingerprints must not be recorded
+        report = self.sync_groups(partial, full=True, save=False, record=False)
+        report.merge(self.sync_groups(complete, full=True))
+        return report
+
+    def changed_groups(self, ldap_group_list: SimpleGroupList, full: bool, report: SyncReport) -> list[tuple[SimpleGroup, str]]:
+        """the groups to sync with their LDAP fingerprint, the unchanged ones are reported as skipped"""
+        self.__known = {}
+        changed: list[tuple[SimpleGroup, str]] = []
+        with self.spans.span(PHASE, 'diff'):
+            for ldap_group in ldap_group_list:
+                ldap_fp = fingerprint(ldap_group.members)
+                if not full and self.group_unchanged(ldap_group, ldap_fp=ldap_fp):
+                    report.skipped_groups.append(ldap_group.name)
+                    self.events.group(ldap_group.name, 'skipped', members=len(ldap_group.members))
+                else:
+                    changed.append((ldap_group, ldap_fp))
+        return changed
+
+    def sync_groups(self, ldap_group_list: SimpleGroupList, full: bool = False, save: bool = True,
+                    record: bool = True, provision: bool = True) -> SyncReport:
+        report = SyncReport()
+        full_paths = [self.mygitlab.group_path(i.name) for i in ldap_group_list]
+        with self.spans.span(PHASE, 'parents'):
+            if self.config.gitlab.scoped_snapshot:
+                self.mygitlab.set_scope(full_paths)
+            self.mygitlab.ensure_parents(full_paths, visibility=self.config.gitlab.new_group_visibility)
+        changed = self.changed_groups(ldap_group_list, full=full, report=report)
+        if provision and changed and self.config.gitlab.create_user:
+            with self.spans.span(PHASE, 'provision'):
+                report.users = self.provision_users([i[0] for i in changed])
+        # with provision off the caller already provisioned the users
+        provisioned = {i.extern_uid: i for i in report.users}
+        for ldap_group, ldap_fp in changed:
+            full_path = self.mygitlab.group_path(ldap_group.name)
+            created = self.mygitlab.group_index.get(full_path) is None
             try:
-                self.modify_group_user_into_gitlab_from_ldap(ldap_group=ldap_group)
-            except:
-                pass
+                with self.spans.span(PHASE, 'groups'), self.spans.span(GROUP, ldap_group.name):
+                    gitlab_group, added, missing = self.modify_group_user_into_gitlab_from_ldap(ldap_group=ldap_group,
+                                                                                                provisioned=provisioned)
+            except Exception as e:
+                self.state.forget(ldap_group.name)
+                report.failed_groups.append(ldap_group.name)
+                self.events.group(ldap_group.name, 'failed', error=repr(e))
+                continue
+            report.synced_groups.append(ldap_group.name)
+            self.events.group(ldap_group.name, 'synced', members=len(ldap_group.members),
+                              added=len(added), missing=len(missing))
+            if not record:
+                continue
+            gitlab_fp = self.gitlab_fingerprint(gitlab_group)
+            if created:
+                # GitLab also made the creating user a member
+                member_ids = self.mygitlab.get_member_ids(full_path=full_path)
+                if member_ids is not None:
+                    gitlab_fp = fingerprint(member_ids)
+            self.state.update(name=ldap_group.name, ldap=ldap_fp, gitlab=gitlab_fp, missing=missing)
+        if save and not self.mygitlab.dry_run:
+            self.state.save()
+        self.events.flush()
+        return report
+
+
+def shard_events(events: str, index: int) -> str:
+    """the event log of a shard worker: a file of its own next to the main one, none when logging to stdout"""
+    if not events or events == '-':
+        return ''
+    return '{events}.{index}'.format(events=events, index=index)
+
+
+def new_user_table(users: MyUserList) -> str:
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    fd, filename = tempfile.mkstemp(prefix='gitlab-ldap-sync-', suffix='.users', dir=directory)
+    os.close(fd)
+    write_user_table(users, filename)
+    return filename
+
+
+def run_shard(sync: Sync, groups: list[SimpleGroup], user_table: str = None,
+              full: bool = False) -> tuple[SyncReport, dict[str, GroupState]]:
+    """
+    @description   :    sync the groups of one shard, without saving the state
+    ---------
+    @Returns       :    tuple[report, state of the shard's groups (None for a forgotten group), or None on a dry run]
+    -------
+    """
+    if user_table is not None:
+        sync.mygitlab.use_user_table(UserTable(user_table))
+    report = sync.sync_groups(SimpleGroupList(groups=groups), full=full, save=False, provision=False)
+    if sync.mygitlab.dry_run:
+        return report, None
+    return report, {i.name: sync.state.groups.get(i.name) for i in groups}
+
+
+def sync_shard(config: Sync_Config, groups: list[SimpleGroup], user_table: str = None,
+               full: bool = False) -> tuple[SyncReport, dict[str, GroupState]]:
+    return run_shard(Sync(config=config), groups=groups, user_table=user_table, full=full)
+
+
+def merge_shards(results: list[tuple[SyncReport, dict[str, GroupState]]], state: SyncState) -> SyncReport:
+    report = SyncReport()
+    changed = False
+    for shard_report, shard_state in results:
+        report.merge(shard_report)
+        if shard_state is None:
+            continue
+        changed = True
+        for name, value in shard_state.items():
+            if value is None:
+                state.forget(name)
+            else:
+                state.groups[name] = value
+    if changed:
+        state.save()
+    return report
 
 
 if __name__ == '__main__':
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Any, Iterable
+
+
+def normalise(key: Any) -> str:
+    return str(key).strip().lower()
+
+
+def fingerprint(keys: Iterable[Any]) -> str:
+    """
+    @description   :    hash of the sorted, normalised member keys of a group
+    ---------
+    @Returns       :    hex digest, independent of the member order and case
+    -------
+    """
+    digest = hashlib.sha1()
+    for key in sorted({normalise(i) for i in keys}):
+        digest.update(key.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+@dataclass
+class GroupState:
+    ldap: str = ''
+    gitlab: str = ''
+    missing: list[str] = field(default_factory=list)
+
+
+@dataclass
+class SyncState:
+    filename: str = ''
+    groups: dict[str, GroupState] = field(default_factory=dict)
+
+    def load(self) -> None:
+        self.groups = {}
+        if not self.filename or not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for name, value in data.get('groups', {}).items():
+            self.groups[name] = GroupState(**value)
+
+    def save(self) -> None:
+        if not self.filename:
+            return
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'groups': {k: asdict(v) for k, v in self.groups.items()}}, f, indent=4, sort_keys=True)
+        os.replace(tmp, self.filename)
+
+    def unchanged(self, name: str, ldap: str, gitlab: str = None) -> bool:
+        """
+        @description   :    the group was fully synced last time and its LDAP side did not change since;
+                            the GitLab side is only compared when its fingerprint is given
+        ---------
+        """
+        state = self.groups.get(name)
+        if state is None or state.ldap != ldap:
+            return False
+        return gitlab is None or state.gitlab == gitlab
+
+    def update(self, name: str, ldap: str, gitlab: str, missing: list[str] = None) -> None:
+        self.groups[name] = GroupState(ldap=ldap, gitlab=gitlab, missing=list(missing or []))
+
+    def forget(self, name: str) -> None:
+        self.groups.pop(name, None)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import time of the sync modules, measured in fresh interpreters with `python -X importtime`.
+
+    ./bench_import.py [-n 5] [module ...]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+MODULES = ['cli', 'Sync', 'MultiSync', 'MyGitlab', 'MyLDAP']
+HEAVY = ['gitlab', 'ldap3', 'requests', 'ldap']
+
+
+def import_time(module: str) -> tuple[int, list[str]]:
+    """
+    @description   :    import module in a new interpreter
+    ---------
+    @Returns       :    tuple[cumulative import time in us, heavy modules loaded by the import]
+    -------
+    """
+    code = 'import sys, {module}; print(",".join(i for i in {heavy!r} if i in sys.modules))'.format(module=module, heavy=HEAVY)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True)
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative = int(parts[1])
+    heavy = [i for i in result.stdout.strip().split(',') if i]
+    return cumulative, heavy
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--number', type=int, default=5, help='runs per module, the best one is kept')
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    args = parser.parse_args()
+    print('{module:<12}{best:>12}  heavy imports'.format(module='module', best='best (ms)'))
+    for module in args.modules:
+        runs = [import_time(module) for i in range(args.number)]
+        best = min(i[0] for i in runs)
+        print('{module:<12}{best:>12.1f}  {heavy}'.format(module=module, best=best / 1000,
+                                                          heavy=', '.join(runs[0][1]) or '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Entry point of the sync.
+
+    ./cli.py check-config [-c config.json]      validate the config, without importing ldap3 or python-gitlab
+    ./cli.py plan [-c config.json] [--full]     show what would be done, without writing into GitLab
+    ./cli.py sync [-c config.json] [--full]     run the sync
+    ./cli.py sync --user DN --group NAME        sync only these users and groups (both repeatable)
+    ./cli.py sync --profile DIR                 also write sync.pstats, sync.collapsed and spans.json into DIR
+    ./cli.py profile-report DIR                 list the slowest phases, groups and GitLab endpoints of a profiled run
+
+LDAP and GitLab clients are only imported by the commands which connect.
+"""
+import argparse
+import os
+import sys
+from typing import Any
+
+
+def check_config(args: argparse.Namespace) -> int:
+    from Sync import Sync_Config
+    config = Sync_Config()
+    try:
+        config.read_from_json(args.config)
+    except (OSError, KeyError, ValueError) as e:
+        print('Cannot read {config}: {error!r}'.format(config=args.config, error=e))
+        return 1
+    errors = config.validate()
+    for error in errors:
+        print(error)
+    if errors:
+        return 1
+    print('{config} is valid'.format(config=args.config))
+    return 0
+
+
+def load_sync(config: str) -> Any:
+    from Sync import Sync
+    try:
+        return Sync(config=config)
+    except (OSError, KeyError, ValueError) as e:
+        print('Cannot start the sync from {config}: {error}'.format(config=config, error=e))
+        return None
+
+
+def plan(args: argparse.Namespace) -> int:
+    sync = load_sync(args.config)
+    if sync is None:
+        return 1
+    for group in sync.plan(full=args.full):
+        if group.skip:
+            print('{path}: unchanged, skipped'.format(path=group.full_path))
+            continue
+        print('{path}: {action}{add} to add, {create} to create, {missing} not in GitLab'.format(
+            path=group.full_path,
+            action='create group, ' if group.create else '',
+            add=len(group.add),
+            create=len(group.create_user),
+            missing=len(group.missing)
+        ))
+    return 0
+
+
+def sync(args: argparse.Namespace) -> int:
+    runner = load_sync(args.config)
+    if runner is None:
+        return 1
+
+    def run():
+        if args.user or args.group:
+            return runner.sync_targets(users=args.user, groups=args.group)
+        return runner.sync(full=args.full)
+
+    if args.profile:
+        from Profile import SPANS_FILE, profile_run, summary
+        spans = runner.enable_spans()
+        try:
+            report = profile_run(run, directory=args.profile, interval=args.profile_interval)
+        finally:
+            spans.save(os.path.join(args.profile, SPANS_FILE))
+        print(summary(spans))
+    else:
+        report = run()
+    print('{synced} synced, {skipped} skipped, {failed} failed'.format(
+        synced=len(report.synced_groups),
+        skipped=len(report.skipped_groups),
+        failed=len(report.failed_groups)
+    ))
+    return 1 if report.failed_groups else 0
+
+
+def profile_report(args: argparse.Namespace) -> int:
+    from Profile import SPANS_FILE, SpanRecorder, summary
+    try:
+        spans = SpanRecorder.load(os.path.join(args.directory, SPANS_FILE))
+    except (OSError, ValueError, TypeError) as e:
+        print('Cannot read the spans of {directory}: {error!r}'.format(directory=args.directory, error=e))
+        return 1
+    print(summary(spans, top=args.top))
+    return 0
+
+
+def parser() -> argparse.ArgumentParser:
+    main_parser = argparse.ArgumentParser(description='Sync LDAP groups into GitLab.')
+    commands = main_parser.add_subparsers(dest='command', required=True)
+    for name, func, help in (('check-config', check_config, 'validate the config file'),
+                             ('plan', plan, 'show what sync would change'),
+                             ('sync', sync, 'sync LDAP groups into GitLab')):
+        command = commands.add_parser(name, help=help)
+        command.add_argument('-c', '--config', default='./config.json', help='path of the config file')
+        if func is not check_config:
+            command.add_argument('--full', action='store_true', help='ignore the fingerprints of the last sync')
+        if func is sync:
+            command.add_argument('--user', action='append', default=[], metavar='DN',
+                                 help='only sync the groups of this LDAP user')
+            command.add_argument('--group', action='append', default=[], metavar='NAME',
+                                 help='only sync this LDAP group')
+            command.add_argument('--profile', default='', metavar='DIR',
+                                 help='profile the run, writing pstats, collapsed stacks and spans into DIR')
+            command.add_argument('--profile-interval', type=float, default=0.005, metavar='SECONDS',
+                                 help='interval of the stack sampler')
+        command.set_defaults(func=func)
+    command = commands.add_parser('profile-report', help='list the slowest spans of a profiled run')
+    command.add_argument('directory', help='directory given to sync --profile')
+    command.add_argument('-n', '--top', type=int, default=10, help='rows per section')
+    command.set_defaults(func=profile_report)
+    return main_parser
+
+
+def main(argv: list[str] = None) -> int:
+    args = parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,6 +8,8 @@ import ldap
 import ldap.asyncsearch
 import logging
 
+from EventLog import EventLog
+
 
 if __name__ == "__main__":
     print('Initializing gitlab-ldap-sync.')
@@ -29,6 +31,7 @@ if __name__ == "__main__":
         if config['log_level']:
             log_option['level'] = getattr(logging, str(config['log_level']).upper())
         logging.basicConfig(**log_option)
+        events = EventLog(filename=config.get('events', ''), sample=config.get('event_sample', 0.0))
 
         print('Done.')
         logging.info('Connecting to GitLab')
@@ -73,7 +76,6 @@ if __name__ == "__main__":
                 gitlab_group = {"name": group.full_name, "members": []}
                 for member in group.members.list(all=True):
                     user = gl.users.get(member.id)
-                    print(user)
                     identities = None
                     if len(user.identities) > 0:
                         identities = user.identities[0]['extern_uid']
@@ -133,15 +135,16 @@ if __name__ == "__main__":
                 ldap_groups.append(ldap_group)
             logging.info('Done.')
 
-            logging.info('Groups currently in GitLab : %s' % str.join(', ', gitlab_groups_names))
-            logging.info('Groups currently in LDAP : %s' % str.join(', ', ldap_groups_names))
+            logging.info('Groups currently in GitLab : %s', len(gitlab_groups_names))
+            logging.info('Groups currently in LDAP : %s', len(ldap_groups_names))
+            logging.debug('Groups currently in GitLab : %s', gitlab_groups_names)
+            logging.debug('Groups currently in LDAP : %s', ldap_groups_names)
 
             logging.info('Syncing Groups from LDAP.')
 
             for l_group in ldap_groups:
-                logging.info('Working on group %s ...' % l_group['name'])
+                counts = {'added': 0, 'created': 0, 'unknown': 0, 'kept': 0}
                 if l_group['name'] not in gitlab_groups_names:
-                    logging.info('|- Group not existing in GitLab, creating.')
                     gitlab_group = {'name': l_group['name'], 'path': l_group['name'], 'visibility': gitlab_config['group_visibility']}
                     if gitlab_config['add_description'] and 'description' in l_group:
                         gitlab_group.update({'description': l_group['description']})
@@ -151,16 +154,16 @@ if __name__ == "__main__":
                         gitlab_groups.append({'members': [], 'name': l_group['name']})
                         gitlab_groups_names.append(l_group['name'])
                     except Exception as e:
-                        logging.error('Creating group %s failed: %s' % (l_group['name'], e))
+                        logging.error('Creating group %s failed: %s', l_group['name'], e)
+                        events.group(l_group['name'], 'failed', error=str(e))
                         # Skip next steps due to group could not be created
                         continue
+                    group_status = 'created'
                 else:
-                    logging.info('|- Group already exist in GitLab, skiping creation.')
+                    group_status = 'exists'
 
-                logging.info('|- Working on group\'s members.')
                 for l_member in l_group['members']:
                     if l_member not in gitlab_groups[gitlab_groups_names.index(l_group['name'])]['members']:
-                        logging.info('|  |- User %s is member in LDAP but not in GitLab, updating GitLab.' % l_member['name'])
                         g = [group for group in gl.groups.list(search=l_group['name']) if group.name == l_group['name']][0]
                         g.save()
                         u = gl.users.list(search=l_member['username'])
@@ -169,9 +172,10 @@ if __name__ == "__main__":
                             if u not in g.members.list(all=True):
                                 g.members.create({'user_id': u.id, 'access_level': gitlab.DEVELOPER_ACCESS})
                             g.save()
+                            counts['added'] += 1
+                            events.member('member_added', group=l_group['name'], user=l_member['username'])
                         else:
                             if gitlab_config['create_user']:
-                                logging.info('|  |- User %s does not exist in gitlab, creating.' % l_member['name'])
                                 try:
                                     u = gl.users.create({
                                         'email': l_member['email'],
@@ -181,49 +185,61 @@ if __name__ == "__main__":
                                         'provider': gitlab_config['ldap_provider'],
                                         'password': 'pouetpouet'
                                     })
-                                except gitlab.exceptions as e:
-                                    if e.response_code == '409':
-                                        u = gl.users.create({
-                                            'email': l_member['email'].replace('@', '+gl-%s@' % l_member['username']),
-                                            'name': l_member['name'],
-                                            'username': l_member['username'],
-                                            'extern_uid': l_member['identities'],
-                                            'provider': gitlab_config['ldap_provider'],
-                                            'password': 'pouetpouet'
-                                        })
+                                except gitlab.exceptions.GitlabCreateError as e:
+                                    if e.response_code != 409:
+                                        raise
+                                    u = gl.users.create({
+                                        'email': l_member['email'].replace('@', '+gl-%s@' % l_member['username']),
+                                        'name': l_member['name'],
+                                        'username': l_member['username'],
+                                        'extern_uid': l_member['identities'],
+                                        'provider': gitlab_config['ldap_provider'],
+                                        'password': 'pouetpouet'
+                                    })
                                 g.members.create({'user_id': u.id, 'access_level': gitlab.DEVELOPER_ACCESS})
                                 g.save()
+                                counts['created'] += 1
+                                events.member('user_created', group=l_group['name'], user=l_member['username'])
                             else:
-                                logging.info('|  |- User %s does not exist in gitlab, skipping.' % l_member['name'])
+                                counts['unknown'] += 1
+                                events.member('user_unknown', group=l_group['name'], user=l_member['username'])
                     else:
-                        logging.info('|  |- User %s already in gitlab group, skipping.' % l_member['name'])
-                logging.info('Done.')
+                        counts['kept'] += 1
+                        events.member('member_kept', group=l_group['name'], user=l_member['username'])
+                logging.info('Group %s (%s): %d added, %d created, %d not in GitLab, %d already member',
+                             l_group['name'], group_status, counts['added'], counts['created'], counts['unknown'], counts['kept'])
+                events.group(l_group['name'], group_status, **counts)
 
             logging.info('Done.')
 
             logging.info('Cleaning membership of LDAP Groups')
 
             for g_group in gitlab_groups:
-                logging.info('Working on group %s ...' % g_group['name'])
-                if g_group['name'] in ldap_groups_names:
-                    logging.info('|- Working on group\'s members.')
-                    for g_member in g_group['members']:
-                        if g_member not in ldap_groups[ldap_groups_names.index(g_group['name'])]['members']:
-                            if str(ldap_config['users_base_dn']).lower() not in g_member['identities']:
-                                logging.info('|  |- Not a LDAP user, skipping.')
-                            else:
-                                logging.info('|  |- User %s no longer in LDAP Group, removing.' % g_member['name'])
-                                g = [group for group in gl.groups.list(search=g_group['name']) if group.name == g_group['name']][0]
-                                u = gl.users.list(search=g_member['username'])[0]
-                                if u is not None:
-                                    g.members.delete(u.id)
-                                    g.save()
+                if g_group['name'] not in ldap_groups_names:
+                    events.member('group_not_ldap', group=g_group['name'])
+                    continue
+                counts = {'removed': 0, 'kept': 0, 'not_ldap': 0}
+                for g_member in g_group['members']:
+                    if g_member not in ldap_groups[ldap_groups_names.index(g_group['name'])]['members']:
+                        if str(ldap_config['users_base_dn']).lower() not in g_member['identities']:
+                            counts['not_ldap'] += 1
+                            events.member('member_not_ldap', group=g_group['name'], user=g_member['username'])
                         else:
-                            logging.info('|  |- User %s still in LDAP Group, skipping.' % g_member['name'])
-                    logging.info('|- Done.')
-                else:
-                    logging.info('|- Not a LDAP group, skipping.')
-                logging.info('Done')
+                            g = [group for group in gl.groups.list(search=g_group['name']) if group.name == g_group['name']][0]
+                            u = gl.users.list(search=g_member['username'])[0]
+                            if u is not None:
+                                g.members.delete(u.id)
+                                g.save()
+                            counts['removed'] += 1
+                            events.member('member_removed', group=g_group['name'], user=g_member['username'])
+                    else:
+                        counts['kept'] += 1
+                        events.member('member_kept', group=g_group['name'], user=g_member['username'])
+                logging.info('Group %s cleaned: %d removed, %d still in LDAP, %d not LDAP users',
+                             g_group['name'], counts['removed'], counts['kept'], counts['not_ldap'])
+                events.group(g_group['name'], 'cleaned', **counts)
+            events.close()
+            logging.info('Done')
         else:
             logging.error('GitLab API is empty, aborting.')
             sys.exit(1)